@@ -0,0 +1,93 @@
+"""Compare Chunker against the original decode-per-window chunk_text.
+
+    python -m bench.chunk_bench --pages 2000
+    python -m bench.chunk_bench --text big_manual.txt
+
+Checks that both produce identical chunks, then reports the time for each.
+"""
+import argparse
+import json
+import random
+import time
+
+import tiktoken
+
+from rag.chunking import Chunker
+
+
+def legacy_chunk_text(text, chunk_tokens=450, overlap_tokens=80):
+    """chunk_text as it was before offset-based slicing"""
+    enc = tiktoken.get_encoding("cl100k_base")
+    tokens = enc.encode(text)
+
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = start + chunk_tokens
+        chunk = enc.decode(tokens[start:end])
+        chunks.append(chunk)
+        start = end - overlap_tokens
+        if start < 0:
+            start = 0
+    return chunks
+
+
+def synthetic_text(pages, seed=0):
+    """Policy-like text, with some non-ASCII characters, of roughly `pages` pages"""
+    rng = random.Random(seed)
+    words = ("policy claim deductible premium coverage beneficiary renewal "
+             "exclusion rider café naïve €500 — “quoted” ☂ 保险").split()
+    lines = []
+    for _ in range(pages * 40):
+        lines.append(" ".join(rng.choice(words) for _ in range(rng.randint(6, 14))))
+    return "\n".join(lines)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000, help="size of the synthetic document")
+    parser.add_argument("--text", help="chunk this text file instead of synthetic text")
+    parser.add_argument("--docs", type=int, default=8, help="documents for the batch comparison")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.text:
+        with open(args.text, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = synthetic_text(args.pages)
+
+    chunker = Chunker()
+    chunker.chunk("warm up")
+    legacy, legacy_s = timed(lambda: legacy_chunk_text(text), args.repeat)
+    fast, fast_s = timed(lambda: chunker.chunk(text), args.repeat)
+    if fast != legacy:
+        raise SystemExit("Chunker output differs from legacy chunk_text")
+
+    docs = [text] * args.docs
+    _, legacy_batch_s = timed(lambda: [legacy_chunk_text(d) for d in docs], args.repeat)
+    _, fast_batch_s = timed(lambda: chunker.chunk_many(docs), args.repeat)
+
+    print(json.dumps({
+        "chars": len(text),
+        "chunks": len(fast),
+        "identical": True,
+        "single_doc": {"legacy_s": round(legacy_s, 4), "chunker_s": round(fast_s, 4),
+                       "speedup": round(legacy_s / fast_s, 2)},
+        "batch": {"docs": args.docs, "legacy_s": round(legacy_batch_s, 4),
+                  "chunker_s": round(fast_batch_s, 4), "speedup": round(legacy_batch_s / fast_batch_s, 2)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""End-to-end pipeline benchmark on a synthetic corpus, answered by a local fake LLM.
+
+    python -m bench.e2e_bench --docs 20 --pages 30 --out bench_result.json
+    python -m bench.e2e_bench --corpus data/corpus --requests 500 --concurrency 32
+    python -m bench.e2e_bench --baseline last_release.json
+
+Times each stage on the same corpus: PDF generation, pdf_to_text,
+chunk_text, embed_texts, index build, retrieve, and /chat under concurrent
+load. For the /chat stage, the backend and bench.fake_llm run as local uvicorn
+processes and the index is served as a throwaway collection, so neither
+Groq nor data/ is touched. Results are written as JSON. With --baseline,
+any throughput or latency figure more than --tolerance worse than the
+baseline is listed and the exit status is 1.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import httpx
+import numpy as np
+
+from rag.bm25 import BM25Builder, bm25_path
+from rag.chunk_store import save_chunks
+from rag.chunking import chunk_text
+from rag.embed_store import INDEX_TYPE, build_index, bump_index_version, embed_texts
+from rag.embedder import EMBED_BACKEND, EMBED_MODEL_NAME
+from rag.knowledge_base import new_version, publish, version_paths
+from rag.pdf_to_text import pdf_to_text
+from rag.rag_answer import RETRIEVE_K, retrieve
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLLECTION = "bench"
+
+# (stage, metric, True if higher is better) compared against a baseline
+TRACKED = [
+    ("pdf_to_text", "docs_per_second", True),
+    ("chunk_text", "chunks_per_second", True),
+    ("embed_texts", "chunks_per_second", True),
+    ("index_build", "seconds", False),
+    ("retrieve", "p50_ms", False),
+    ("retrieve", "p99_ms", False),
+    ("chat", "requests_per_second", True),
+    ("chat", "p50_ms", False),
+    ("chat", "p99_ms", False),
+]
+
+
+def load_generator():
+    """data/generate_sample_pdf.py, which is a script rather than a package module"""
+    path = os.path.join(BACKEND_DIR, "data", "generate_sample_pdf.py")
+    spec = importlib.util.spec_from_file_location("generate_sample_pdf", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentiles(seconds):
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def make_queries(chunks, n, seed=0):
+    """Questions built from sentences that appear in the corpus"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        sentences = [s.strip() for s in rng.choice(chunks).split(".") if len(s.split()) > 5]
+        sentence = rng.choice(sentences) if sentences else rng.choice(chunks)[:200]
+        queries.append(f"What does the policy say: {sentence}?")
+    return queries
+
+
+def save_collection(collections_dir, index, chunks):
+    """Publish index and chunks as a collection the backend can serve"""
+    data_dir = os.path.join(collections_dir, COLLECTION)
+    version = new_version(data_dir)
+    paths = version_paths(data_dir, version)
+    faiss.write_index(index, paths["index"])
+    save_chunks(paths["meta"], chunks)
+    lexical = BM25Builder()
+    for i, chunk in enumerate(chunks):
+        lexical.add(i, chunk)
+    lexical.build().save(bm25_path(paths["index"]))
+    bump_index_version(paths["index"])
+    publish(data_dir, version)
+
+
+def start_server(app, port, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+def wait_ready(url, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+async def chat_load(url, queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        async def one(query):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json={"message": query, "collection": COLLECTION})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in queries))
+        wall = time.perf_counter() - started
+
+    result = {"requests": len(queries), "concurrency": concurrency, "errors": errors,
+              "seconds": round(wall, 3), "requests_per_second": round(len(latencies) / wall, 2)}
+    if latencies:
+        result.update(percentiles(latencies))
+    return result
+
+
+def bench_chat(index, chunks, queries, args):
+    collections_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    save_collection(collections_dir, index, chunks)
+    env = dict(
+        os.environ,
+        GROQ_API_KEY="fake",
+        GROQ_BASE_URL=f"http://127.0.0.1:{args.llm_port}",
+        COLLECTIONS_DIR=collections_dir,
+        # Every request should reach retrieval and the LLM
+        ANSWER_CACHE_ENABLED="0",
+        EMBED_WARMUP="1",
+    )
+    servers = [start_server("bench.fake_llm:app", args.llm_port, env),
+               start_server("main:app", args.port, env)]
+    try:
+        wait_ready(f"http://127.0.0.1:{args.llm_port}/openapi.json")
+        wait_ready(f"http://127.0.0.1:{args.port}/stats")
+        url = f"http://127.0.0.1:{args.port}/chat"
+        # Loads the collection before timing starts
+        asyncio.run(chat_load(url, queries[:1], 1))
+        return asyncio.run(chat_load(url, queries, args.concurrency))
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def compare(result, baseline, tolerance):
+    """Tracked figures that got worse than the baseline by more than tolerance"""
+    regressions = []
+    for stage, metric, higher_is_better in TRACKED:
+        old = baseline.get("stages", {}).get(stage, {}).get(metric)
+        new = result["stages"].get(stage, {}).get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append({"stage": stage, "metric": metric, "baseline": old, "current": new,
+                                "change": round(change, 4)})
+    return regressions
+
+
+def run(args):
+    stages = {}
+
+    corpus_dir = args.corpus
+    if corpus_dir is None:
+        corpus_dir = tempfile.mkdtemp(prefix="rag-corpus-")
+        started = time.perf_counter()
+        load_generator().create_synthetic_corpus(corpus_dir, args.docs, args.pages, args.seed)
+        stages["generate"] = {"docs": args.docs, "pages_per_doc": args.pages,
+                              "seconds": round(time.perf_counter() - started, 3)}
+    pdfs = sorted(os.path.join(corpus_dir, f) for f in os.listdir(corpus_dir) if f.lower().endswith(".pdf"))
+    if not pdfs:
+        raise SystemExit(f"No PDFs in {corpus_dir}")
+
+    started = time.perf_counter()
+    texts = [pdf_to_text(path) for path in pdfs]
+    seconds = time.perf_counter() - started
+    stages["pdf_to_text"] = {"docs": len(pdfs), "chars": sum(len(t) for t in texts),
+                             "seconds": round(seconds, 3), "docs_per_second": round(len(pdfs) / seconds, 2)}
+
+    started = time.perf_counter()
+    chunks = [chunk for text in texts for chunk in chunk_text(text)]
+    seconds = time.perf_counter() - started
+    stages["chunk_text"] = {"chunks": len(chunks), "seconds": round(seconds, 3),
+                            "chunks_per_second": round(len(chunks) / seconds, 1)}
+
+    started = time.perf_counter()
+    vectors = embed_texts(chunks)
+    seconds = time.perf_counter() - started
+    stages["embed_texts"] = {"chunks": len(chunks), "seconds": round(seconds, 3),
+                             "chunks_per_second": round(len(chunks) / seconds, 1)}
+
+    started = time.perf_counter()
+    index = build_index(vectors, args.index_type)
+    stages["index_build"] = {"index_type": args.index_type, "vectors": int(index.ntotal),
+                             "seconds": round(time.perf_counter() - started, 3)}
+
+    queries = make_queries(chunks, max(args.queries, args.requests), args.seed)
+    latencies = []
+    for query in queries[:args.queries]:
+        started = time.perf_counter()
+        retrieve(query, index, chunks)
+        latencies.append(time.perf_counter() - started)
+    stages["retrieve"] = {"queries": args.queries, "k": RETRIEVE_K, **percentiles(latencies)}
+
+    if args.requests:
+        stages["chat"] = bench_chat(index, chunks, queries[:args.requests], args)
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "embed_model": EMBED_MODEL_NAME,
+            "embed_backend": EMBED_BACKEND,
+            "index_type": args.index_type,
+            "retrieve_k": RETRIEVE_K,
+            "fake_llm_latency_ms": float(os.environ.get("FAKE_LLM_LATENCY_MS", "300")),
+        },
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="existing directory of PDFs instead of generating one")
+    parser.add_argument("--docs", type=int, default=10, help="synthetic PDFs to generate")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--index-type", default=INDEX_TYPE)
+    parser.add_argument("--queries", type=int, default=200, help="sequential retrieve calls")
+    parser.add_argument("--requests", type=int, default=200, help="/chat requests (0 skips the load test)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8100, help="port for the backend under test")
+    parser.add_argument("--llm-port", type=int, default=9100, help="port for the fake LLM")
+    parser.add_argument("--baseline", help="earlier result JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    parser.add_argument("--out", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            result["regressions"] = compare(result, json.load(f), args.tolerance)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if result.get("regressions"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
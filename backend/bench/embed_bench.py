@@ -0,0 +1,102 @@
+"""Compare embedding backends: ingest throughput, query latency and parity.
+
+    python -m bench.embed_bench
+    python -m bench.embed_bench --backends torch,onnx-int8 --threads 4 --texts 2000
+
+For each backend, reports chunks/second when encoding ingest-sized batches,
+the p50/p99 latency of one-query encodes, and the cosine similarity of its
+vectors to the torch backend on the same texts (1.0 means identical).
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from rag.embedder import EMBED_BACKENDS, encode, load_model
+from rag.embed_store import EMBED_BATCH_SIZE
+
+
+def synthetic_chunks(n, words_per_chunk=300, seed=0):
+    """Policy-like passages roughly the size of a 450-token chunk"""
+    rng = random.Random(seed)
+    words = ("policy claim deductible premium coverage beneficiary renewal exclusion "
+             "rider insured accident hospital payment agent form number days notice").split()
+    return [" ".join(rng.choice(words) for _ in range(words_per_chunk)) for _ in range(n)]
+
+
+def synthetic_queries(n, seed=1):
+    rng = random.Random(seed)
+    templates = ("How do I file a {} claim?", "What is the {} deductible?",
+                 "When does my {} policy renew?", "Is {} covered?")
+    topics = ("car", "home", "travel", "health", "life", "dental")
+    return [rng.choice(templates).format(rng.choice(topics)) for _ in range(n)]
+
+
+def bench_backend(backend, chunks, queries, threads, batch_size):
+    started = time.perf_counter()
+    model = load_model(backend, threads=threads)
+    load_seconds = time.perf_counter() - started
+
+    encode(queries[:8], model=model)
+    started = time.perf_counter()
+    vectors = np.concatenate([encode(chunks[i:i + batch_size], model=model)
+                              for i in range(0, len(chunks), batch_size)])
+    ingest_seconds = time.perf_counter() - started
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        encode([query], model=model)
+        latencies.append(time.perf_counter() - started)
+    latencies = np.array(latencies) * 1000.0
+
+    return vectors, encode(queries, model=model), {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 3),
+        "ingest_chunks_per_second": round(len(chunks) / ingest_seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "query_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(EMBED_BACKENDS))
+    parser.add_argument("--texts", type=int, default=1000, help="chunks encoded for the ingest test")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = library default)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.texts)
+    queries = synthetic_queries(args.queries)
+    backends = args.backends.split(",")
+    if "torch" not in backends:
+        backends.insert(0, "torch")
+
+    rows = []
+    reference = None
+    for backend in backends:
+        vectors, qvecs, row = bench_backend(backend, chunks, queries, args.threads, args.batch_size)
+        if reference is None:
+            reference = (vectors, qvecs)
+        chunk_cos = (vectors * reference[0]).sum(axis=1)
+        query_cos = (qvecs * reference[1]).sum(axis=1)
+        row["mean_cosine_vs_torch"] = round(float(np.concatenate([chunk_cos, query_cos]).mean()), 6)
+        row["min_cosine_vs_torch"] = round(float(np.concatenate([chunk_cos, query_cos]).min()), 6)
+        rows.append(row)
+
+    text = json.dumps({"texts": len(chunks), "queries": len(queries), "threads": args.threads,
+                       "results": rows}, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
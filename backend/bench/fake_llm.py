@@ -0,0 +1,86 @@
+"""Local stand-in for the Groq chat completions API used in load tests.
+
+Run it and point the backend at it:
+
+    uvicorn bench.fake_llm:app --port 9000
+    GROQ_BASE_URL=http://127.0.0.1:9000 GROQ_API_KEY=fake uvicorn main:app --port 8000
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Simulated time before the completion is returned
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "300"))
+# Simulated delay between streamed tokens
+FAKE_LLM_TOKEN_MS = float(os.environ.get("FAKE_LLM_TOKEN_MS", "10"))
+# Number of words in the canned answer
+FAKE_LLM_ANSWER_WORDS = int(os.environ.get("FAKE_LLM_ANSWER_WORDS", "60"))
+
+app = FastAPI()
+
+
+def fake_answer():
+    words = ["This", "is", "a", "canned", "answer", "from", "the", "fake", "LLM."]
+    return " ".join(words[i % len(words)] for i in range(FAKE_LLM_ANSWER_WORDS))
+
+
+def count_prompt_tokens(messages):
+    return sum(len(str(m.get("content", "")).split()) for m in messages)
+
+
+async def stream_completion(body):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "fake")
+
+    def chunk(delta, finish_reason=None):
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    await asyncio.sleep(FAKE_LLM_LATENCY_MS / 1000.0)
+    yield chunk({"role": "assistant", "content": ""})
+    for i, word in enumerate(fake_answer().split()):
+        await asyncio.sleep(FAKE_LLM_TOKEN_MS / 1000.0)
+        yield chunk({"content": word if i == 0 else " " + word})
+    yield chunk({}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if body.get("stream"):
+        return StreamingResponse(stream_completion(body), media_type="text/event-stream")
+    await asyncio.sleep(FAKE_LLM_LATENCY_MS / 1000.0)
+    answer = fake_answer()
+    prompt_tokens = count_prompt_tokens(body.get("messages", []))
+    completion_tokens = len(answer.split())
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
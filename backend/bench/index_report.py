@@ -0,0 +1,136 @@
+"""Recall-vs-latency report for the ANN index types against the exact flat index.
+
+    python -m bench.index_report --chunks data/chunks.bin --out index_report.json
+    python -m bench.index_report --synthetic 200000 --ef 16,64,256 --nprobe 1,8,32
+
+Each row gives recall@k against IndexFlatIP and the per-query search latency
+(mean and p99), so efSearch / nprobe can be picked from measurements. Rows
+also give the bytes of stored vector codes and the memory saved against the
+float32 flat index, to judge the compressed types (flat-fp16, pq, ivf-pq).
+A row whose type fell back to flat for lack of training vectors is labelled
+flat, with the type that was asked for in requested_type.
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from rag.chunk_store import load_chunks
+from rag.embed_store import build_index, built_index_type, index_memory_bytes, set_search_params
+
+
+def synthetic_vectors(n, dim=384, clusters=256, seed=0):
+    """Clustered, normalized vectors that look roughly like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def chunk_vectors(meta_path):
+    from rag.embed_store import embed_texts
+
+    chunks = load_chunks(meta_path)
+    if hasattr(chunks, "ids"):
+        chunks = [chunks[int(i)] for i in chunks.ids()]
+    elif isinstance(chunks, dict):
+        chunks = [chunks[i] for i in sorted(chunks)]
+    return embed_texts(chunks)
+
+
+def make_queries(vectors, n_queries, seed=1):
+    """Perturbed copies of stored vectors, so queries are near but not on the data"""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), n_queries)]
+    queries = picks + 0.1 * rng.standard_normal(picks.shape).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def timed_search(index, queries, k):
+    latencies = []
+    ids = np.empty((len(queries), k), dtype="int64")
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, row = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - started)
+        ids[i] = row[0]
+    latencies = np.array(latencies) * 1000.0
+    return ids, {
+        "mean_ms": round(float(latencies.mean()), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+    }
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / float(truth.size)
+
+
+def report(vectors, queries, k=4, ef_values=(16, 32, 64, 128), nprobe_values=(1, 4, 16, 64)):
+    exact = build_index(vectors, "flat")
+    truth, exact_latency = timed_search(exact, queries, k)
+    exact_bytes = index_memory_bytes(exact)
+    rows = [{"index_type": "flat", "recall": 1.0, "index_bytes": exact_bytes, "memory_saved": 0.0, **exact_latency}]
+
+    settings = [("flat-fp16", {}), ("pq", {})]
+    settings += [("hnsw", {"ef_search": ef}) for ef in ef_values]
+    settings += [(t, {"nprobe": n}) for t in ("ivf-flat", "ivf-pq") for n in nprobe_values]
+
+    built = {}
+    for index_type, params in settings:
+        if index_type not in built:
+            started = time.perf_counter()
+            built[index_type] = (build_index(vectors, index_type), time.perf_counter() - started)
+        index, build_seconds = built[index_type]
+        set_search_params(index, **params)
+        found, latency = timed_search(index, queries, k)
+        index_bytes = index_memory_bytes(index)
+        # Trained types fall back to flat on small corpora; label the row with what was measured
+        actual_type = built_index_type(len(vectors), index_type)
+        rows.append({
+            "index_type": actual_type,
+            **({"requested_type": index_type} if actual_type != index_type else {}),
+            **params,
+            "recall": round(recall_at_k(found, truth), 4),
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": index_bytes,
+            "memory_saved": round(1.0 - index_bytes / exact_bytes, 4) if index_bytes and exact_bytes else None,
+            **latency,
+        })
+    return {"vectors": len(vectors), "queries": len(queries), "k": k, "results": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--chunks", help="chunk store (or legacy chunks.json) to embed and index")
+    source.add_argument("--synthetic", type=int, help="number of synthetic vectors to index")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--ef", default="16,32,64,128", help="comma-separated efSearch values")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="comma-separated nprobe values")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    vectors = chunk_vectors(args.chunks) if args.chunks else synthetic_vectors(args.synthetic)
+    queries = make_queries(vectors, args.queries)
+    result = report(
+        vectors, queries, args.k,
+        ef_values=[int(v) for v in args.ef.split(",")],
+        nprobe_values=[int(v) for v in args.nprobe.split(",")],
+    )
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
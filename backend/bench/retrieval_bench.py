@@ -0,0 +1,112 @@
+"""Compare dense-only and hybrid (dense + BM25) retrieval on known-item queries.
+
+    python -m bench.retrieval_bench --index data/index.faiss --chunks data/chunks.bin
+    python -m bench.retrieval_bench --chunks data/chunks.json --queries 500
+
+Queries are short word spans taken from random chunks, preferring spans with
+numbers or codes (policy numbers, phone numbers, form names). A query counts
+as recalled when its source chunk is in the top k. Reports recall@k and p50 /
+p99 retrieval latency for both modes as JSON.
+"""
+import argparse
+import json
+import random
+import time
+
+import faiss
+import numpy as np
+
+from rag.bm25 import BM25Builder, load_bm25
+from rag.chunk_store import load_chunks
+from rag.chunking import chunk_body
+from rag.embed_store import embed_texts, load_index
+from rag.embedder import encode
+from rag.hybrid import hybrid_ids
+
+
+def chunk_ids(chunks):
+    """FAISS ids that hold a chunk, for stores, id-keyed dicts and plain lists"""
+    if hasattr(chunks, "ids"):
+        return [int(i) for i in chunks.ids()]
+    if isinstance(chunks, dict):
+        return sorted(chunks)
+    return list(range(len(chunks)))
+
+
+def make_queries(chunks, ids, n, span=6, seed=0):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        chunk_id = int(rng.choice(ids))
+        words = chunk_body(chunks[chunk_id]).split()
+        if not words:
+            continue
+        coded = [i for i, w in enumerate(words) if any(c.isdigit() for c in w)]
+        center = rng.choice(coded) if coded and rng.random() < 0.5 else rng.randrange(len(words))
+        start = max(0, center - span // 2)
+        queries.append((" ".join(words[start:start + span]), chunk_id))
+    return queries
+
+
+def run(queries, search, k):
+    latencies, hits = [], 0
+    for query, expected in queries:
+        started = time.perf_counter()
+        found = search(query, k)
+        latencies.append(time.perf_counter() - started)
+        hits += int(expected in set(int(i) for i in found))
+    latencies = np.array(latencies) * 1000.0
+    return {
+        "recall": round(hits / float(len(queries)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", required=True, help="chunk store (.bin) or legacy chunks.json")
+    parser.add_argument("--index", help="existing index.faiss; built in memory when omitted")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="BM25 latency budget for the hybrid run")
+    args = parser.parse_args()
+
+    if args.index:
+        index, chunks = load_index(args.index, args.chunks)
+        lexical = load_bm25(args.index)
+    else:
+        chunks = load_chunks(args.chunks)
+        index, lexical = None, None
+    ids = chunk_ids(chunks)
+
+    if index is None:
+        vectors = embed_texts([chunks[i] for i in ids])
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    if lexical is None:
+        builder = BM25Builder()
+        for i in ids:
+            builder.add(int(i), chunk_body(chunks[i]))
+        lexical = builder.build()
+
+    queries = make_queries(chunks, ids, args.queries)
+    encode(["warm up"])
+
+    def dense(query, k):
+        return index.search(encode([query]), k)[1][0]
+
+    def hybrid(query, k):
+        return hybrid_ids(encode([query]), query, index, lexical, k, budget_ms=args.budget_ms)[0]
+
+    print(json.dumps({
+        "chunks": len(ids),
+        "queries": len(queries),
+        "k": args.k,
+        "dense": run(queries, dense, args.k),
+        "hybrid": run(queries, hybrid, args.k),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
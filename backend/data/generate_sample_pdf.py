@@ -5,16 +5,10 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
 
-def create_insurance_policy_pdf(path="data/knowledge.pdf"):
+def make_styles():
     """
-    Creates a comprehensive insurance policy document with detailed coverage information.
-    This PDF will serve as the knowledge base for your RAG system.
+    Returns the sample stylesheet plus the custom title, heading, subheading and body styles.
     """
-    
-    doc = SimpleDocTemplate(path, pagesize=letter,
-                           topMargin=0.75*inch, bottomMargin=0.75*inch)
-    
-    # Get default styles
     styles = getSampleStyleSheet()
     
     # Create custom styles
@@ -55,6 +49,19 @@ def create_insurance_policy_pdf(path="data/knowledge.pdf"):
         alignment=TA_JUSTIFY,
         spaceAfter=12
     )
+
+    return styles, title_style, heading_style, subheading_style, body_style
+
+def create_insurance_policy_pdf(path="data/knowledge.pdf"):
+    """
+    Creates a comprehensive insurance policy document with detailed coverage information.
+    This PDF will serve as the knowledge base for your RAG system.
+    """
+    
+    doc = SimpleDocTemplate(path, pagesize=letter,
+                           topMargin=0.75*inch, bottomMargin=0.75*inch)
+    
+    styles, title_style, heading_style, subheading_style, body_style = make_styles()
     
     # Build the document content
     story = []
@@ -465,5 +472,91 @@ def create_insurance_policy_pdf(path="data/knowledge.pdf"):
     print(f"✓ Insurance policy PDF created successfully at: {path}")
     print(f"✓ Document contains comprehensive coverage information for RAG system")
 
+PRODUCTS = ["Health", "Life", "Property", "Auto", "Travel", "Dental", "Pet", "Disability"]
+TOPICS = ["Coverage Details", "Exclusions and Limitations", "Premium Information", "Claims Process",
+          "Customer Service", "Cancellation Policy", "Renewal Terms", "Deductibles", "Waiting Periods"]
+TERMS = ["policyholder", "beneficiary", "deductible", "premium", "co-pay", "rider", "adjuster", "claim",
+         "coverage limit", "grace period", "endorsement", "underwriting", "dependent", "reimbursement"]
+VERBS = ["covers", "excludes", "requires", "limits", "extends", "reimburses", "applies to", "waives"]
+
+def _sentence(rng):
+    """
+    One policy-like sentence with amounts and day counts so chunks differ from each other.
+    """
+    return (f"The {rng.choice(TERMS)} {rng.choice(VERBS)} the {rng.choice(TERMS)} "
+            f"up to ${rng.randint(1, 500) * 100:,} within {rng.choice([7, 14, 30, 60, 90])} days "
+            f"of the {rng.choice(TERMS)}.")
+
+def create_synthetic_policy_pdf(path, pages=20, seed=0):
+    """
+    Creates an insurance policy PDF of roughly `pages` pages with randomized sections, tables and FAQs.
+    The same seed always produces the same document, so benchmark runs are comparable.
+    """
+    import random
+
+    rng = random.Random(seed)
+    doc = SimpleDocTemplate(path, pagesize=letter,
+                           topMargin=0.75*inch, bottomMargin=0.75*inch)
+    styles, title_style, heading_style, subheading_style, body_style = make_styles()
+    product = rng.choice(PRODUCTS)
+
+    story = []
+    story.append(Paragraph(f"{product.upper()} INSURANCE POLICY", title_style))
+    story.append(Paragraph(f"Policy Number: INS-{2020 + seed % 10}-{rng.randint(100000, 999999)}", styles['Normal']))
+    story.append(PageBreak())
+
+    for page in range(1, pages):
+        topic = rng.choice(TOPICS)
+        story.append(Paragraph(f"{page}. {topic.upper()}", heading_style))
+        for sub in range(1, 4):
+            story.append(Paragraph(f"{page}.{sub} {product} {topic}", subheading_style))
+            story.append(Paragraph(" ".join(_sentence(rng) for _ in range(rng.randint(4, 8))), body_style))
+        if rng.random() < 0.3:
+            rows = [['Service Type', 'Coverage Amount', 'Deductible']]
+            rows += [[f"{rng.choice(TERMS).title()}", f"${rng.randint(1, 90) * 500:,}", f"${rng.randint(0, 20) * 50}"]
+                     for _ in range(rng.randint(3, 6))]
+            table = Table(rows, colWidths=[2.5*inch, 1.8*inch, 1.8*inch])
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2d3748')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('FONTSIZE', (0, 0), (-1, -1), 9)
+            ]))
+            story.append(table)
+        else:
+            question = f"How does the {rng.choice(TERMS)} work for {product.lower()} coverage?"
+            story.append(Paragraph(f"<b>{question}</b>", body_style))
+            story.append(Paragraph(_sentence(rng) + " " + _sentence(rng), body_style))
+        story.append(PageBreak())
+
+    doc.build(story)
+
+def create_synthetic_corpus(out_dir="data/corpus", documents=10, pages=20, seed=0):
+    """
+    Creates `documents` synthetic policy PDFs of about `pages` pages each in out_dir and returns their paths.
+    """
+    import os
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(out_dir, f"policy_{i:04d}.pdf")
+        create_synthetic_policy_pdf(path, pages, seed + i)
+        paths.append(path)
+    return paths
+
 if __name__ == "__main__":
-    create_insurance_policy_pdf()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate the sample policy PDF or a synthetic benchmark corpus")
+    parser.add_argument("--docs", type=int, default=0, help="number of synthetic PDFs (0 writes data/knowledge.pdf)")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--out", default="data/corpus", help="directory for the synthetic PDFs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.docs:
+        paths = create_synthetic_corpus(args.out, args.docs, args.pages, args.seed)
+        print(f"✓ {len(paths)} synthetic policy PDFs created in: {args.out}")
+    else:
+        create_insurance_policy_pdf()
\ No newline at end of file
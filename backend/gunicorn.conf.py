@@ -0,0 +1,19 @@
+"""Prefork server with the model and indexes loaded once before workers fork.
+
+    pip install gunicorn
+    gunicorn -c gunicorn.conf.py main:app
+
+main is imported in the parent with STARTUP_MODE=preload, so the embedding
+model and the STARTUP_COLLECTIONS indexes are loaded there. The forked
+workers share those pages copy-on-write, and each one warms its own thread
+pools in its startup hook before it takes traffic.
+"""
+import os
+
+os.environ.setdefault("STARTUP_MODE", "preload")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
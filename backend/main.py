@@ -1,14 +1,36 @@
+import json
 import os
-from fastapi import FastAPI
+import threading
+import time
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 load_dotenv()
 
-from rag.pdf_to_text import pdf_to_text
-from rag.chunking import chunk_text
-from rag.embed_store import build_and_save_index, load_index
-from rag.rag_answer import retrieve, generate_answer
+from rag.pdf_to_text import iter_pages
+from rag.chunking import chunk_pages
+from rag.embed_store import build_and_save_index_stream
+from rag.corpus import ingest_corpus
+from rag.jobs import JobRunner, counted, load_job
+from rag.knowledge_base import (
+    KnowledgeBase, current_version, discard, migrate_legacy, new_version, publish, version_exists, version_paths,
+)
+from rag.registry import DEFAULT_COLLECTION, CollectionRegistry
+from rag.rag_answer import (
+    embed_query, retrieve_scored, is_answerable, handoff, prompt_context, generate_answer_async, stream_answer,
+    citations, answer_many,
+)
+from rag.answer_cache import cache_stats
+from rag.sessions import condense_query, sessions
+from rag.embedder import warm_up, embedding_stats
+from rag.rerank import warm_up as warm_up_rerank
+from rag.metrics import snapshot as metrics_snapshot, histogram, render_prometheus
+from rag.tracing import TracingMiddleware, record, span
+from rag import startup as startup_mode
 
 app = FastAPI()
 
@@ -22,38 +44,347 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-request stage spans, request latency and the slow-request profiler
+app.add_middleware(TracingMiddleware)
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 PDF_PATH = os.path.join(DATA_DIR, "knowledge.pdf")
-INDEX_PATH = os.path.join(DATA_DIR, "index.faiss")
-META_PATH = os.path.join(DATA_DIR, "chunks.json")
 
-index = None
-chunks = None
+# Directory of PDFs to ingest incrementally instead of the single PDF_PATH
+CORPUS_DIR = os.environ.get("CORPUS_DIR")
+
+NOT_INGESTED = "Knowledge base not ingested yet. Call /ingest first."
+
+# Load the embedding model at startup instead of on the first request
+EMBED_WARMUP = os.environ.get("EMBED_WARMUP", "0") == "1"
+
+# Loaded knowledge bases, one per collection, under a memory ceiling
+registry = CollectionRegistry(DATA_DIR)
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")
+ingest_runners = {}
+runners_lock = threading.Lock()
+
+stream_ttfb_hist = histogram("chat_stream_ttfb_seconds", "Time to first byte of /chat/stream")
+stream_ttlb_hist = histogram("chat_stream_ttlb_seconds", "Time to last byte of /chat/stream")
+
+startup_mode.record_app_import("main")
+if startup_mode.STARTUP_MODE == "preload":
+    # Under gunicorn --preload this runs once in the parent, before workers fork
+    migrate_legacy(DATA_DIR)
+    startup_mode.preload(registry)
+
+@app.on_event("startup")
+def startup():
+    # Publish a pre-versioning data/ layout before any request loads it
+    migrate_legacy(DATA_DIR)
+    if startup_mode.STARTUP_MODE in ("warm", "preload"):
+        startup_mode.warm(registry)
+    elif EMBED_WARMUP:
+        warm_up()
+        warm_up_rerank()
 
 class ChatIn(BaseModel):
     message: str
+    # Named knowledge base to answer from; omitted means the default collection
+    collection: Optional[str] = None
+    # Conversation to continue; "" or an expired id starts a new one, and the
+    # response carries the id to send next time. Omitted means no history.
+    session_id: Optional[str] = None
 
-@app.post("/ingest")
-def ingest():
-    global index, chunks
-    text = pdf_to_text(PDF_PATH)
-    chunks = chunk_text(text)
-    build_and_save_index(chunks, INDEX_PATH, META_PATH)
-    index, chunks = load_index(INDEX_PATH, META_PATH)
-    return {"status": "ok", "chunks": len(chunks)}
+class ChatBatchIn(BaseModel):
+    messages: list[str]
+    collection: Optional[str] = None
 
-@app.post("/chat")
-def chat(payload: ChatIn):
-    global index, chunks
+def ingest_runner(name):
+    """Job runner of one collection; each collection ingests one job at a time"""
+    with runners_lock:
+        runner = ingest_runners.get(name)
+        if runner is None:
+            runner = ingest_runners[name] = JobRunner(f"ingest:{name}", JOBS_DIR)
+        return runner
 
-    if index is None or chunks is None:
-        if os.path.exists(INDEX_PATH) and os.path.exists(META_PATH):
-            index, chunks = load_index(INDEX_PATH, META_PATH)
+def build_version(job, name):
+    """Build a complete new version of a collection to the side, then publish and swap it in"""
+    data_dir = registry.data_dir(name)
+    migrate_legacy(data_dir)
+    previous = current_version(data_dir)
+    source = version_paths(data_dir, previous)
+    corpus_dir = CORPUS_DIR if name == DEFAULT_COLLECTION else registry.docs_dir(name)
+    if corpus_dir and not os.path.isdir(corpus_dir):
+        raise FileNotFoundError(f"No documents directory at {corpus_dir}")
+    version = new_version(data_dir)
+    paths = version_paths(data_dir, version)
+    try:
+        if corpus_dir:
+            result = ingest_corpus(
+                corpus_dir, paths["index"], paths["meta"], paths["manifest"],
+                source=(source["index"], source["meta"], source["manifest"]), progress=job.progress,
+            )
+            if not (result["added"] or result["updated"] or result["removed"]) and version_exists(source):
+                # Nothing changed; keep serving the published version
+                discard(data_dir, version)
+                return {"collection": name, "version": previous, **result}
         else:
-            return {"answer": "Knowledge base not ingested yet. Call /ingest first."}
+            pages = counted(iter_pages(PDF_PATH), job.progress, "pages")
+            chunk_iter = counted(chunk_pages(pages, doc=os.path.basename(PDF_PATH)), job.progress, "chunks")
+            result = {"chunks": build_and_save_index_stream(
+                chunk_iter, paths["index"], paths["meta"], progress=job.progress
+            )}
+        if not version_exists(paths):
+            discard(data_dir, version)
+            return {"collection": name, "version": previous, **result}
+        loaded = KnowledgeBase.load(paths, version)
+    except BaseException:
+        discard(data_dir, version)
+        raise
+    publish(data_dir, version)
+    registry.install(name, loaded)
+    return {"collection": name, "version": version, **result}
+
+def collection_name(collection):
+    try:
+        return registry.validate(collection)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+@app.post("/ingest", status_code=202)
+def ingest(collection: Optional[str] = None):
+    """Start a background ingestion job for a collection (or return the one already running)"""
+    name = collection_name(collection)
+    if name != DEFAULT_COLLECTION and not os.path.isdir(registry.docs_dir(name)):
+        # Checked before a job runner is created for the name
+        raise HTTPException(status_code=404, detail=f"No documents directory for collection {name}")
+    job, started = ingest_runner(name).submit(lambda job: build_version(job, name))
+    return {"job_id": job.id, "collection": name, "status": job.status, "started": started}
+
+@app.get("/ingest/{job_id}")
+def ingest_status(job_id: str):
+    """Progress of an ingestion job: pages parsed, chunks embedded and throughput"""
+    with runners_lock:
+        runners = list(ingest_runners.values())
+    for runner in runners:
+        status = runner.get(job_id)
+        if status is not None:
+            return status
+    status = load_job(JOBS_DIR, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    return status
+
+async def get_kb(collection):
+    """(name, knowledge base snapshot) to use for a whole request; the snapshot is None if nothing was ingested"""
+    name = collection_name(collection)
+    knowledge = registry.resident(name)
+    if knowledge is None:
+        knowledge = await run_in_threadpool(registry.load, name)
+    return name, knowledge
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def lookup_answer(message, cache):
+    """Return (cached answer or None, query vector or None)
+
+    The exact-match level is checked before the query is embedded; the
+    semantic level reuses the query vector that retrieval needs anyway.
+    """
+    if cache is not None:
+        with span("answer_cache"):
+            cached = cache.get_exact(message)
+        if cached is not None:
+            return cached, None
+    qvec = await run_in_threadpool(embed_query, message)
+    if cache is not None:
+        with span("answer_cache"):
+            cached = cache.get_semantic(qvec)
+        if cached is not None:
+            return cached, qvec
+    return None, qvec
+
+def remember_answer(cache, message, qvec, result, history=None):
+    """Cache an answer that every client can be served
+
+    Answers written with a session's earlier turns in the prompt may refer to
+    that conversation, so they are never shared.
+    """
+    if cache is None or (history is not None and (history[0] or history[1])):
+        return
+    cache.put(message, qvec, result)
+
+async def open_session(payload):
+    """(session or None, retrieval query); follow-ups are condensed into standalone queries"""
+    if payload.session_id is None:
+        return None, payload.message
+    session = sessions.get_or_create(payload.session_id)
+    return session, await condense_query(session, payload.message)
+
+def session_history(session):
+    return session.history() if session is not None else None
+
+def end_turn(session, message, query, answer, result=None):
+    """Record the turn in the session and tag the response with its id"""
+    if session is None:
+        return result
+    sessions.add_turn(session, message, query, answer)
+    return None if result is None else {**result, "session_id": session.id}
+
+@app.post("/chat")
+async def chat(payload: ChatIn):
+    started = time.perf_counter()
+    name, knowledge = await get_kb(payload.collection)
+    if knowledge is None:
+        return {"answer": NOT_INGESTED}
+
+    cache = registry.answer_cache(name)
+    try:
+        session, query = await open_session(payload)
+        cached, qvec = await lookup_answer(query, cache)
+        if cached is not None:
+            return end_turn(session, payload.message, query, cached["answer"], cached)
+
+        hits, _, best = await run_in_threadpool(
+            retrieve_scored, query, knowledge.index, knowledge.chunks,
+            lexical=knowledge.lexical, version=knowledge.index_version, qvec=qvec,
+        )
+        if not is_answerable(best):
+            # Nothing relevant was retrieved; hand off without calling the LLM
+            result = handoff()
+            return end_turn(session, payload.message, query, result["answer"], result)
+        history = session_history(session)
+        context, used = prompt_context(hits)
+        answer = await generate_answer_async(payload.message, context, history)
+        result = {"answer": answer, "citations": citations(used)}
+        remember_answer(cache, query, qvec, result, history)
+        return end_turn(session, payload.message, query, answer, result)
+    finally:
+        registry.observe(name, time.perf_counter() - started)
+
+@app.post("/chat/stream")
+async def chat_stream(payload: ChatIn, request: Request):
+    """Stream retrieval results, then answer tokens, as Server-Sent Events"""
+    started = time.perf_counter()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    name, knowledge = await get_kb(payload.collection)
+    if knowledge is None:
+        # No cache or stats are kept for collections that were never ingested
+        return StreamingResponse(iter([sse("error", {"error": NOT_INGESTED})]),
+                                 media_type="text/event-stream", headers=headers)
+    cache = registry.answer_cache(name)
+
+    async def events():
+        first_byte = True
+        try:
+            session, query = await open_session(payload)
+            tagged = {} if session is None else {"session_id": session.id}
+            cached, qvec = await lookup_answer(query, cache)
+            if cached is not None:
+                yield sse("retrieval", {"chunks": [], "citations": cached["citations"], **tagged})
+                stream_ttfb_hist.observe(time.perf_counter() - started)
+                first_byte = False
+                yield sse("token", {"text": cached["answer"]})
+                end_turn(session, payload.message, query, cached["answer"])
+                yield sse("done", {"cached": True})
+                return
+
+            hits, _, best = await run_in_threadpool(
+                retrieve_scored, query, knowledge.index, knowledge.chunks,
+                lexical=knowledge.lexical, version=knowledge.index_version, qvec=qvec,
+            )
+            if not is_answerable(best):
+                result = handoff()
+                yield sse("retrieval", {"chunks": [], "citations": [], **tagged})
+                stream_ttfb_hist.observe(time.perf_counter() - started)
+                first_byte = False
+                yield sse("token", {"text": result["answer"]})
+                end_turn(session, payload.message, query, result["answer"])
+                yield sse("done", {"handoff": True})
+                return
+            context, used = prompt_context(hits)
+            cited = citations(used)
+            yield sse("retrieval", {"chunks": hits, "citations": cited, **tagged})
+            stream_ttfb_hist.observe(time.perf_counter() - started)
+            first_byte = False
+
+            answer = []
+            history = session_history(session)
+            tokens = stream_answer(payload.message, context, history)
+            llm_started = time.perf_counter()
+            try:
+                async for token in tokens:
+                    if await request.is_disconnected():
+                        return
+                    if not answer:
+                        record("llm_first_token", time.perf_counter() - llm_started)
+                    answer.append(token)
+                    yield sse("token", {"text": token})
+            except Exception:
+                yield sse("error", {"error": "Answer generation failed."})
+                return
+            finally:
+                # Closes the upstream Groq stream when the client goes away
+                await tokens.aclose()
+                record("llm", time.perf_counter() - llm_started)
+            remember_answer(cache, query, qvec, {"answer": "".join(answer), "citations": cited}, history)
+            end_turn(session, payload.message, query, "".join(answer))
+            yield sse("done", {})
+        finally:
+            elapsed = time.perf_counter() - started
+            if first_byte:
+                stream_ttfb_hist.observe(elapsed)
+            stream_ttlb_hist.observe(elapsed)
+            registry.observe(name, elapsed)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+@app.post("/chat/batch")
+async def chat_batch(payload: ChatBatchIn):
+    """Answer many questions; results stream back as NDJSON in input order"""
+    started = time.perf_counter()
+    name, knowledge = await get_kb(payload.collection)
+    if knowledge is None:
+        return StreamingResponse(iter([json.dumps({"error": NOT_INGESTED}) + "\n"]),
+                                 media_type="application/x-ndjson")
+
+    async def lines():
+        try:
+            async for result in answer_many(payload.messages, knowledge.index, knowledge.chunks,
+                                            lexical=knowledge.lexical):
+                yield json.dumps(result) + "\n"
+        finally:
+            registry.observe(name, time.perf_counter() - started)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/sessions")
+def create_session():
+    """Start a conversation; pass the returned session_id to /chat and /chat/stream"""
+    return {"session_id": sessions.get_or_create().id}
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"deleted": session_id}
+
+@app.get("/stats")
+def stats():
+    return {
+        "embedding": embedding_stats(),
+        "answer_cache": cache_stats(DEFAULT_COLLECTION),
+        "collections": registry.stats(),
+        "sessions": sessions.stats(),
+        "startup": startup_mode.startup_stats(),
+        "metrics": metrics_snapshot(),
+    }
 
-    hits = retrieve(payload.message, index, chunks)
-    answer = generate_answer(payload.message, hits)
-    return {"answer": answer}
\ No newline at end of file
+@app.get("/metrics")
+def metrics():
+    """Counters and histograms in the Prometheus text format"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,191 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from rag.metrics import counter
+
+# Cache answers in front of /chat (0 disables)
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_MB = float(os.environ.get("ANSWER_CACHE_MAX_MB", "64"))
+# Cosine similarity above which a past question counts as the same question
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.92"))
+
+exact_hits = counter("answer_cache_exact_hits_total", "Answers served from the exact-match cache")
+semantic_hits = counter("answer_cache_semantic_hits_total", "Answers served from the semantic cache")
+misses = counter("answer_cache_misses_total", "Questions that missed both cache levels")
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", text.lower())).strip()
+
+class AnswerCache:
+    """Two-level answer cache: exact normalized text, then query-vector similarity
+
+    Entries are evicted least-recently-used once max_entries or max_bytes is
+    exceeded, and expire after ttl_seconds. Vectors live in one matrix (grown
+    on demand) so the semantic lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 max_bytes=int(ANSWER_CACHE_MAX_MB * 1024 * 1024), threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self._entries = OrderedDict()  # key -> (slot, created, size, value)
+        self._vectors = None
+        self._slot_keys = []
+        self._free_slots = []
+        self._bytes = 0
+        # Hits and misses of this cache; the module counters sum all caches
+        self.exact_hits = self.semantic_hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    def _size(self, key, value):
+        return len(key) + sum(len(str(v)) for v in value.values()) + self._vectors.shape[1] * 4
+
+    def _drop(self, key):
+        slot, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self._vectors[slot] = 0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def _grow(self, dim):
+        """Double the vector matrix, up to max_entries rows"""
+        old = 0 if self._vectors is None else len(self._vectors)
+        new = min(self.max_entries, max(256, old * 2))
+        vectors = np.zeros((new, dim), dtype="float32")
+        if old:
+            vectors[:old] = self._vectors
+        self._vectors = vectors
+        self._slot_keys.extend([None] * (new - old))
+        self._free_slots.extend(range(new - 1, old - 1, -1))
+
+    def _expired(self, created):
+        return time.monotonic() - created > self.ttl
+
+    def get_exact(self, query):
+        key = normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            exact_hits.inc()
+            return entry[3]
+
+    def get_semantic(self, qvec):
+        """Answer of the most similar cached question, if above the threshold"""
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                misses.inc()
+                return None
+            scores = self._vectors @ qvec.reshape(-1)
+            while True:
+                slot = int(np.argmax(scores))
+                if scores[slot] < self.threshold:
+                    break
+                key = self._slot_keys[slot]
+                if self._expired(self._entries[key][1]):
+                    self._drop(key)
+                    scores[slot] = -1.0
+                    continue
+                self._entries.move_to_end(key)
+                self.semantic_hits += 1
+                semantic_hits.inc()
+                return self._entries[key][3]
+            self.misses += 1
+            misses.inc()
+            return None
+
+    def put(self, query, qvec, value):
+        if self.max_entries <= 0:
+            # A cache with no room stores nothing
+            return
+        key = normalize(query)
+        qvec = np.asarray(qvec, dtype="float32").reshape(-1)
+        with self._lock:
+            if self._vectors is None:
+                self._grow(qvec.shape[0])
+            if key in self._entries:
+                self._drop(key)
+            size = self._size(key, value)
+            if size > self.max_bytes:
+                return
+            if not self._free_slots and len(self._vectors) < self.max_entries:
+                self._grow(qvec.shape[0])
+            while self._entries and (not self._free_slots or self._bytes + size > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            self._vectors[slot] = qvec
+            self._slot_keys[slot] = key
+            self._entries[key] = (slot, time.monotonic(), size, value)
+            self._bytes += size
+
+    def clear(self):
+        """Drop every entry, e.g. after the knowledge base changed"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._vectors = None
+            self._slot_keys = []
+            self._free_slots = []
+
+    def stats(self):
+        return dict(entries=len(self._entries), bytes=self._bytes,
+                    **_hit_stats(self.exact_hits, self.semantic_hits, self.misses))
+
+def _hit_stats(exact, semantic, missed):
+    total = exact + semantic + missed
+    return {
+        "exact_hits": exact,
+        "semantic_hits": semantic,
+        "misses": missed,
+        "hit_rate": round((exact + semantic) / total, 4) if total else 0.0,
+    }
+
+# A zero-entry cache could never hit, so it is treated as disabled
+answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED and ANSWER_CACHE_MAX_ENTRIES > 0 else None
+
+_collection_caches = {}
+_collection_lock = threading.Lock()
+
+def cache_for(collection=None):
+    """Answer cache of one collection, so tenants never see each other's answers
+
+    None (the default collection) uses the module-level answer_cache.
+    """
+    if answer_cache is None or collection is None:
+        return answer_cache
+    with _collection_lock:
+        cache = _collection_caches.get(collection)
+        if cache is None:
+            cache = _collection_caches[collection] = AnswerCache()
+        return cache
+
+def cache_stats(default_name="default"):
+    """Entries, bytes and hits of every collection's cache, plus process-wide totals"""
+    if answer_cache is None:
+        return None
+    with _collection_lock:
+        caches = dict(_collection_caches)
+    caches[default_name] = answer_cache
+    return {
+        "collections": {name: caches[name].stats() for name in sorted(caches)},
+        "process": _hit_stats(exact_hits.value, semantic_hits.value, misses.value),
+    }
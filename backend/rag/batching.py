@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from rag.embedder import encode
+from rag.metrics import histogram
+
+# How long to wait for more queries while others are queued (0 disables batching)
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5"))
+# Upper bound on queries encoded in one forward pass
+EMBED_MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "32"))
+
+batch_size_hist = histogram(
+    "embed_batch_size", "Queries encoded per batched forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+queue_delay_hist = histogram(
+    "embed_queue_delay_seconds", "Time a query waited before its batch was encoded",
+)
+
+
+class QueryBatcher:
+    """Coalesce concurrent single-query embeddings into batched encode calls"""
+
+    def __init__(self, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH, encode_fn=encode):
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.encode_fn = encode_fn
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, query):
+        """Queue a query and return a Future resolving to its (1, dim) vector"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((query, future, time.perf_counter()))
+        return future
+
+    def embed(self, query):
+        """Embed one query, sharing a forward pass with concurrent callers"""
+        return self.submit(query).result()
+
+    def _collect(self):
+        """Next batch; a query that arrives alone is encoded without waiting
+
+        The window is only spent when other queries are already queued, i.e.
+        when requests are actually arriving concurrently.
+        """
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) == 1:
+            return batch
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                queue_delay_hist.observe(started - enqueued)
+            batch_size_hist.observe(len(batch))
+            try:
+                vectors = self.encode_fn([query for query, _, _ in batch])
+            except Exception as exc:
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(vectors[i:i + 1])
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Return the process-wide query batcher, or None when batching is disabled"""
+    global _batcher
+    if EMBED_BATCH_WINDOW_MS <= 0:
+        return None
+    if _batcher is not None:
+        return _batcher
+    # Concurrent first requests must not each start a batcher thread
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = QueryBatcher()
+    return _batcher
@@ -0,0 +1,155 @@
+"""BM25 inverted index stored as sparse (COO/CSR) numpy arrays.
+
+Postings are kept as parallel arrays of term id, FAISS id and term frequency,
+sorted by term, with per-document lengths. BM25 weights are computed once at
+load time, so a query is a few array slices and one bincount.
+"""
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# BM25 saturation and length normalization
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+
+# Keeps policy numbers, phone numbers and form names like "ins-2025-847392" whole
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+
+def tokenize(text):
+    """Lowercase terms; compound terms are also indexed by their parts"""
+    terms = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        terms.append(match)
+        if not match.isalnum():
+            terms.extend(re.split(r"[-./]", match))
+    return terms
+
+
+def bm25_path(index_path):
+    return index_path + ".bm25.npz"
+
+
+class BM25Index:
+    def __init__(self, vocab, term_ids, doc_ids, tfs, doc_len, k1=BM25_K1, b=BM25_B):
+        order = np.argsort(term_ids, kind="stable")
+        self.vocab = list(vocab)
+        self.term_index = {term: i for i, term in enumerate(self.vocab)}
+        self.term_ids = np.asarray(term_ids, dtype=np.int32)[order]
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)[order]
+        self.tfs = np.asarray(tfs, dtype=np.int32)[order]
+        self.doc_len = np.asarray(doc_len, dtype=np.int32)
+        self.indptr = np.searchsorted(self.term_ids, np.arange(len(self.vocab) + 1)).astype(np.int64)
+        self.weights = self._weights(k1, b)
+
+    def _weights(self, k1, b):
+        present = self.doc_len > 0
+        n_docs = max(int(np.count_nonzero(present)), 1)
+        avgdl = float(self.doc_len[present].mean()) if present.any() else 1.0
+        df = np.diff(self.indptr)
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        tf = self.tfs.astype(np.float32)
+        dl = self.doc_len[self.doc_ids].astype(np.float32)
+        norm = tf + k1 * (1.0 - b + b * dl / avgdl)
+        return idf[self.term_ids] * tf * (k1 + 1.0) / norm
+
+    def search(self, query, k):
+        """Top-k (ids, scores) for the query; ids are FAISS ids"""
+        term_ids = [self.term_index[t] for t in set(tokenize(query)) if t in self.term_index]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        unique, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+        return unique[top], scores[top]
+
+    def without(self, stale_ids):
+        """Postings and lengths with the given documents removed"""
+        keep = ~np.isin(self.doc_ids, np.asarray(list(stale_ids), dtype=np.int64))
+        doc_len = self.doc_len.copy()
+        stale = [i for i in stale_ids if i < len(doc_len)]
+        doc_len[stale] = 0
+        return self.term_ids[keep], self.doc_ids[keep], self.tfs[keep], doc_len
+
+    def save(self, path):
+        vocab = np.frombuffer("\n".join(self.vocab).encode("utf-8"), dtype=np.uint8)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, vocab=vocab, term_ids=self.term_ids, doc_ids=self.doc_ids,
+                 tfs=self.tfs, doc_len=self.doc_len)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            text = data["vocab"].tobytes().decode("utf-8")
+            vocab = text.split("\n") if text else []
+            return cls(vocab, data["term_ids"], data["doc_ids"], data["tfs"], data["doc_len"])
+
+
+class BM25Builder:
+    """Accumulate documents, then produce a BM25Index"""
+
+    def __init__(self, base=None, stale_ids=()):
+        self.vocab = []
+        self.term_index = {}
+        self.term_ids, self.doc_ids, self.tfs = [], [], []
+        self.doc_len = {}
+        if base is not None:
+            # Start from an existing index minus the documents being replaced
+            self.vocab = list(base.vocab)
+            self.term_index = dict(base.term_index)
+            term_ids, doc_ids, tfs, doc_len = base.without(stale_ids)
+            self.term_ids, self.doc_ids, self.tfs = [term_ids], [doc_ids], [tfs]
+            self.doc_len = {int(i): int(n) for i, n in enumerate(doc_len) if n}
+
+    def add(self, doc_id, text):
+        counts = Counter(tokenize(text))
+        ids = []
+        for term in counts:
+            if term not in self.term_index:
+                self.term_index[term] = len(self.vocab)
+                self.vocab.append(term)
+            ids.append(self.term_index[term])
+        self.term_ids.append(np.asarray(ids, dtype=np.int32))
+        self.doc_ids.append(np.full(len(ids), doc_id, dtype=np.int64))
+        self.tfs.append(np.fromiter(counts.values(), dtype=np.int32, count=len(counts)))
+        self.doc_len[int(doc_id)] = sum(counts.values())
+
+    def build(self):
+        doc_len = np.zeros(max(self.doc_len, default=-1) + 1, dtype=np.int32)
+        for doc_id, n in self.doc_len.items():
+            doc_len[doc_id] = n
+
+        def joined(parts, dtype):
+            return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+        return BM25Index(
+            self.vocab,
+            joined(self.term_ids, np.int32),
+            joined(self.doc_ids, np.int64),
+            joined(self.tfs, np.int32),
+            doc_len,
+        )
+
+
+def load_bm25(index_path):
+    """BM25 index built next to index_path, or None if there is none"""
+    path = bm25_path(index_path)
+    return BM25Index.load(path) if os.path.exists(path) else None
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=60):
+    """Merge ranked id lists; each list contributes 1 / (rrf_k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            if doc_id == -1:
+                continue
+            scores[int(doc_id)] = scores.get(int(doc_id), 0.0) + 1.0 / (rrf_k + rank + 1)
+    return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda item: -item[1])[:k]]
@@ -0,0 +1,147 @@
+"""Compact chunk metadata store: a UTF-8 blob plus an offsets array.
+
+Record i (the FAISS id) is the JSON bytes blob[offsets[i]:offsets[i + 1]].
+Both files are memory-mapped, so every worker shares the OS page cache and
+only the records that retrieval actually returns get decoded.
+
+Convert an existing chunks.json with:
+
+    python -m rag.chunk_store data/chunks.json data/chunks.bin
+"""
+import json
+import mmap
+import os
+import sys
+import uuid
+
+import numpy as np
+
+
+def _offsets_path(path):
+    return path + ".idx"
+
+
+class ChunkStoreWriter:
+    """Append records to a new store, addressed by sequential or explicit ids
+
+    The blob and the offsets are replaced one after the other on close, so
+    a store that readers use should be written into a new version directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Unique, so concurrent writers of the same path never share a file
+        self._tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        self._blob = open(self._tmp, "wb")
+        self._offsets = [0]
+
+    def add_raw(self, data, chunk_id=None):
+        if chunk_id is not None:
+            if chunk_id < len(self._offsets) - 1:
+                raise ValueError("chunk ids must be added in increasing order")
+            # Gaps (removed ids) are empty records
+            self._offsets.extend([self._offsets[-1]] * (chunk_id - (len(self._offsets) - 1)))
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def add(self, record, chunk_id=None):
+        self.add_raw(json.dumps(record, ensure_ascii=False).encode("utf-8"), chunk_id)
+
+    def close(self):
+        self._blob.close()
+        offsets_tmp = _offsets_path(self._tmp)
+        with open(offsets_tmp, "wb") as f:
+            np.save(f, np.asarray(self._offsets, dtype=np.int64))
+        os.replace(self._tmp, self.path)
+        os.replace(offsets_tmp, _offsets_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._blob.close()
+            os.remove(self._tmp)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a chunk store"""
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = np.load(_offsets_path(path), mmap_mode="r")
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._blob = b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def raw(self, i):
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end]
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        data = self.raw(i)
+        if not data:
+            raise KeyError(i)
+        return json.loads(data)
+
+    def get(self, i, default=None):
+        try:
+            return self[i]
+        except (IndexError, KeyError):
+            return default
+
+    def ids(self):
+        """Ids that hold a record (skips gaps left by removed chunks)"""
+        sizes = np.diff(self._offsets)
+        return np.nonzero(sizes)[0]
+
+    def count(self):
+        return int(np.count_nonzero(np.diff(self._offsets)))
+
+
+def save_chunks(path, chunks):
+    """Write a list (sequential ids) or an {id: record} dict of chunks"""
+    with ChunkStoreWriter(path) as writer:
+        if isinstance(chunks, dict):
+            for chunk_id in sorted(chunks):
+                writer.add(chunks[chunk_id], int(chunk_id))
+        else:
+            for chunk in chunks:
+                writer.add(chunk)
+
+
+def load_chunks(path):
+    """Open chunk metadata; legacy .json files are parsed into memory"""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)["chunks"]
+        if isinstance(chunks, dict):
+            chunks = {int(k): v for k, v in chunks.items()}
+        return chunks
+    return ChunkStore(path)
+
+
+def chunks_exist(path):
+    if path.endswith(".json"):
+        return os.path.exists(path)
+    return os.path.exists(path) and os.path.exists(_offsets_path(path))
+
+
+def migrate_json(json_path, store_path):
+    """Convert a chunks.json file into a binary chunk store"""
+    save_chunks(store_path, load_chunks(json_path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        raise SystemExit("usage: python -m rag.chunk_store CHUNKS_JSON STORE_PATH")
+    migrate_json(sys.argv[1], sys.argv[2])
@@ -1,16 +1,279 @@
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
 import tiktoken
 
+ENCODING_NAME = "cl100k_base"
+# Threads used by tiktoken when tokenizing many documents at once
+CHUNK_THREADS = int(os.environ.get("CHUNK_THREADS", str(os.cpu_count() or 1)))
+
+@lru_cache(maxsize=None)
+def get_encoder(name: str = ENCODING_NAME):
+    """Return the tiktoken encoding, created once per process"""
+    return tiktoken.get_encoding(name)
+
+@lru_cache(maxsize=None)
+def _token_byte_lengths(name: str = ENCODING_NAME):
+    """Byte length of every token in the vocabulary, indexed by token id"""
+    enc = get_encoder(name)
+    lengths = np.zeros(enc.n_vocab, dtype=np.int64)
+    for token in range(enc.n_vocab):
+        try:
+            lengths[token] = len(enc.decode_single_token_bytes(token))
+        except KeyError:
+            # Unused ids between the regular and special tokens
+            pass
+    return lengths
+
+def _byte_offsets(tokens, lengths):
+    """Byte offset of every token boundary, from the per-token length table"""
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(lengths[np.asarray(tokens, dtype=np.int64)], out=offsets[1:])
+    return offsets
+
+class Chunker:
+    """Fixed token-window chunker that slices the original text by offset
+
+    Chunk boundaries are computed as byte offsets from a per-token length
+    table, so windows are cut out of the source text instead of being decoded
+    from tokens. Output is identical to decoding each token window.
+    """
+
+    def __init__(self, chunk_tokens: int = 450, overlap_tokens: int = 80, encoding_name: str = ENCODING_NAME):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.step = chunk_tokens - overlap_tokens
+        self.encoding_name = encoding_name
+        self.enc = get_encoder(encoding_name)
+
+    def windows(self, num_tokens: int):
+        """(start, end) token positions of every chunk"""
+        return [(s, min(s + self.chunk_tokens, num_tokens)) for s in range(0, num_tokens, self.step)]
+
+    def chunk(self, text: str, tokens=None):
+        if tokens is None:
+            tokens = self.enc.encode(text)
+        windows = self.windows(len(tokens))
+        if not windows:
+            return []
+
+        byte_offsets = _byte_offsets(tokens, _token_byte_lengths(self.encoding_name))
+
+        try:
+            data = text.encode("utf-8")
+        except UnicodeEncodeError:
+            data = b""
+        if byte_offsets[-1] != len(data) or not data:
+            # Tokens do not round-trip to the text; fall back to decoding
+            return [self.enc.decode(tokens[s:e]) for s, e in windows]
+
+        if len(data) == len(text):
+            # ASCII: byte offsets are character offsets
+            return [text[byte_offsets[s]:byte_offsets[e]] for s, e in windows]
+
+        # Map the boundary byte offsets to character offsets by counting
+        # UTF-8 lead bytes between consecutive boundaries
+        is_lead = (np.frombuffer(data, dtype=np.uint8) & 0xC0) != 0x80
+        bounds = sorted({int(byte_offsets[p]) for w in windows for p in w})
+        char_at = {}
+        chars = prev = 0
+        for b in bounds:
+            chars += int(np.count_nonzero(is_lead[prev:b]))
+            char_at[b] = chars
+            prev = b
+
+        chunks = []
+        for s, e in windows:
+            bs, be = int(byte_offsets[s]), int(byte_offsets[e])
+            if (bs == len(data) or is_lead[bs]) and (be == len(data) or is_lead[be]):
+                chunks.append(text[char_at[bs]:char_at[be]])
+            else:
+                # Window starts or ends inside a multi-byte character
+                chunks.append(data[bs:be].decode("utf-8", errors="replace"))
+        return chunks
+
+    def chunk_many(self, texts, num_threads: int = CHUNK_THREADS):
+        """Chunk many documents, tokenizing them in parallel threads"""
+        texts = list(texts)
+        token_lists = self.enc.encode_batch(texts, num_threads=num_threads)
+        return [self.chunk(text, tokens) for text, tokens in zip(texts, token_lists)]
+
 def chunk_text(text: str, chunk_tokens: int = 450, overlap_tokens: int = 80):
-    enc = tiktoken.get_encoding("cl100k_base")
-    tokens = enc.encode(text)
-
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = start + chunk_tokens
-        chunk = enc.decode(tokens[start:end])
-        chunks.append(chunk)
-        start = end - overlap_tokens
-        if start < 0:
-            start = 0
-    return chunks
\ No newline at end of file
+    return Chunker(chunk_tokens, overlap_tokens).chunk(text)
+
+def chunk_stream(pages, chunk_tokens: int = 450, overlap_tokens: int = 80):
+    """Chunk an iterable of (page_number, text) without joining the document
+
+    Windows follow the same start/step rule as chunk_text; only a window's
+    worth of tokens is held at a time. As in Chunker, windows are sliced out
+    of the buffered page bytes at token offsets instead of being decoded.
+    """
+    enc = get_encoder()
+    lengths = _token_byte_lengths()
+    step = max(1, chunk_tokens - overlap_tokens)
+    tokens, data = [], b""
+    first = True
+    for _, text in pages:
+        if not text:
+            continue
+        piece = text if first else "\n" + text
+        first = False
+        piece_tokens = enc.encode(piece)
+        try:
+            piece_bytes = piece.encode("utf-8")
+        except UnicodeEncodeError:
+            piece_bytes = b""
+        if int(lengths[np.asarray(piece_tokens, dtype=np.int64)].sum()) != len(piece_bytes):
+            # Tokens do not round-trip to the text; buffer their bytes instead
+            piece_bytes = enc.decode_bytes(piece_tokens)
+        tokens.extend(piece_tokens)
+        data += piece_bytes
+        if len(tokens) > chunk_tokens:
+            offsets = _byte_offsets(tokens, lengths)
+            starts = range(0, len(tokens) - chunk_tokens, step)
+            for s in starts:
+                yield data[offsets[s]:offsets[s + chunk_tokens]].decode("utf-8", errors="replace")
+            dropped = len(starts) * step
+            data = data[offsets[dropped]:]
+            del tokens[:dropped]
+    offsets = _byte_offsets(tokens, lengths)
+    for s in range(0, len(tokens), step):
+        end = offsets[min(s + chunk_tokens, len(tokens))]
+        yield data[offsets[s]:end].decode("utf-8", errors="replace")
+
+# "tokens" cuts fixed token windows; "structured" splits on headings, Q/A pairs and paragraphs
+CHUNK_MODE = os.environ.get("CHUNK_MODE", "tokens")
+# Token budget for one structured chunk
+STRUCT_CHUNK_TOKENS = int(os.environ.get("STRUCT_CHUNK_TOKENS", "300"))
+
+_HEADING_RE = re.compile(r"^(\d+\.(\d+\.?)*\s+[A-Z].{0,70}|[A-Z][A-Z0-9 ,&/\-]{3,80})$")
+_BLOCK_START_RE = re.compile(r"^(Q:|Question:|Step \d+|[•\-\*]\s)")
+
+def chunk_body(chunk):
+    """Text of a chunk, whether stored as a plain string or a record"""
+    return chunk if isinstance(chunk, str) else chunk["text"]
+
+def _is_heading(line):
+    return not line.endswith((".", ",", ";")) and bool(_HEADING_RE.match(line))
+
+_SENTENCE_END = (".", "!", "?", ":")
+
+def _starts_block(line):
+    return bool(_BLOCK_START_RE.match(line))
+
+def _question_start(block):
+    """Index in block where a question ending on the next line begins
+
+    PDF extraction wraps long questions over several lines; the question
+    starts after the last line that ended a sentence.
+    """
+    for i in range(len(block) - 1, -1, -1):
+        if block[i][1].endswith(_SENTENCE_END):
+            return i + 1
+    return 0
+
+def _units(pages):
+    """Group page lines into ("heading" | "block", page, text) units"""
+    block = []  # (page, line)
+
+    def flush(lines):
+        return "block", lines[0][0], "\n".join(line for _, line in lines)
+
+    for page, text in pages:
+        for line in text.split("\n"):
+            heading = _is_heading(line)
+            if heading or _starts_block(line):
+                if block:
+                    yield flush(block)
+                    block = []
+                if heading:
+                    yield "heading", page, line
+                    continue
+            elif line.endswith("?"):
+                # A question starts a new block, including the lines it was wrapped from
+                start = _question_start(block)
+                if start:
+                    yield flush(block[:start])
+                block = block[start:]
+            block.append((page, line))
+        # A paragraph that ends the page on a full sentence does not run on
+        if block and block[-1][1].endswith((".", "!")):
+            yield flush(block)
+            block = []
+    if block:
+        yield flush(block)
+
+def chunk_structured(pages, doc=None, max_tokens: int = STRUCT_CHUNK_TOKENS):
+    """Chunk (page_number, text) pages along headings, Q/A pairs and paragraphs
+
+    Whole blocks are packed into chunks of at most max_tokens without crossing
+    a section heading; a block larger than the budget is cut into windows.
+    Yields records with text, doc, page and section.
+    """
+    enc = get_encoder()
+    section = None
+    parts, part_tokens, part_page = [], 0, None
+
+    def record(text, page):
+        return {"text": text, "doc": doc, "page": page, "section": section}
+
+    for kind, page, text in _units(pages):
+        if kind == "heading":
+            if parts:
+                yield record("\n".join(parts), part_page)
+            section = text
+            parts, part_tokens, part_page = [], 0, None
+            continue
+        n = len(enc.encode(text))
+        if n > max_tokens:
+            if parts:
+                yield record("\n".join(parts), part_page)
+                parts, part_tokens, part_page = [], 0, None
+            for piece in Chunker(max_tokens, max_tokens // 5).chunk(text):
+                yield record(piece, page)
+            continue
+        if parts and part_tokens + n > max_tokens:
+            yield record("\n".join(parts), part_page)
+            parts, part_tokens, part_page = [], 0, None
+        if not parts:
+            part_page = page
+            # Repeat the heading so a chunk reads on its own
+            if section:
+                parts.append(section)
+                part_tokens += len(enc.encode(section))
+        parts.append(text)
+        part_tokens += n
+    if parts:
+        yield record("\n".join(parts), part_page)
+
+def chunk_pages(pages, doc=None):
+    """Chunk extracted pages using the configured CHUNK_MODE"""
+    if CHUNK_MODE == "structured":
+        return chunk_structured(pages, doc)
+    return chunk_stream(pages)
+
+# Documents joined and tokenized together by chunk_documents in tokens mode
+CHUNK_BATCH_DOCS = int(os.environ.get("CHUNK_BATCH_DOCS", "8"))
+
+def chunk_documents(documents, batch_docs: int = CHUNK_BATCH_DOCS):
+    """Chunk an iterable of (doc, pages), yielding (doc, chunks) in order
+
+    In tokens mode up to batch_docs documents are tokenized in parallel with
+    Chunker.chunk_many; structured mode chunks one document at a time.
+    """
+    if CHUNK_MODE == "structured":
+        for doc, pages in documents:
+            yield doc, list(chunk_structured(pages, doc))
+        return
+    chunker = Chunker()
+    batch = []
+    for doc, pages in documents:
+        batch.append((doc, "\n".join(text for _, text in pages if text)))
+        if len(batch) >= batch_docs:
+            yield from zip([d for d, _ in batch], chunker.chunk_many([t for _, t in batch]))
+            batch = []
+    if batch:
+        yield from zip([d for d, _ in batch], chunker.chunk_many([t for _, t in batch]))
@@ -0,0 +1,125 @@
+"""Prompt context assembly under a token budget.
+
+Retrieved chunks overlap (fixed token windows share 80 tokens) and
+neighbouring hits often repeat each other. Hits are taken in rank order: a
+hit that continues or precedes an already selected span is stitched onto it
+without the shared text, near-duplicates are dropped, and hits that would
+overflow the token budget are skipped.
+"""
+import os
+import re
+
+from rag.chunking import chunk_body, get_encoder
+from rag.metrics import counter, histogram
+
+# Prompt tokens allowed for retrieved context (0 disables the budget)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1800"))
+# Word-set Jaccard similarity above which a hit counts as a duplicate
+CONTEXT_DEDUP_THRESHOLD = float(os.environ.get("CONTEXT_DEDUP_THRESHOLD", "0.85"))
+# Shared text shorter than this is not treated as a chunk overlap
+MIN_OVERLAP_CHARS = 32
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+
+context_tokens = histogram("context_tokens", "Prompt tokens of retrieved context per request", TOKEN_BUCKETS)
+context_tokens_total = counter("context_tokens_total", "Prompt tokens of retrieved context sent to the LLM")
+context_tokens_saved = counter("context_tokens_saved_total", "Context tokens removed by overlap merging, dedup and the budget")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def count_tokens(text):
+    return len(get_encoder().encode(text))
+
+
+def _overlap(left, right):
+    """Length of the longest suffix of left that is a prefix of right"""
+    probe = right[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = left.find(probe)
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _doc(chunk):
+    return chunk.get("doc") if isinstance(chunk, dict) else None
+
+
+class _Span:
+    """Contiguous context text built from one or more hits"""
+
+    def __init__(self, chunk, text, words, tokens):
+        self.doc = _doc(chunk)
+        self.text = text
+        self.words = words
+        self.tokens = tokens
+
+
+def _place(spans, chunk, text, words, threshold):
+    """Return (span, merged_text) for a hit that joins a span, or (None, text)
+
+    merged_text is None when the hit adds nothing new.
+    """
+    for span in spans:
+        if text in span.text or _jaccard(words, span.words) >= threshold:
+            return span, None
+        if span.doc != _doc(chunk):
+            continue
+        n = _overlap(span.text, text)
+        if n:
+            return span, span.text + text[n:]
+        n = _overlap(text, span.text)
+        if n:
+            return span, text + span.text[n:]
+        if span.text in text:
+            return span, text
+    return None, text
+
+
+def build_context(retrieved_chunks, token_budget=CONTEXT_TOKEN_BUDGET, dedup_threshold=CONTEXT_DEDUP_THRESHOLD):
+    """Assemble the prompt context from ranked hits
+
+    Returns (context, tokens, used) where used lists the hits that made it
+    into the context, in rank order.
+    """
+    spans = []
+    used = []
+    tokens = 0
+    raw_tokens = 0
+    for chunk in retrieved_chunks:
+        text = chunk_body(chunk).strip()
+        if not text:
+            continue
+        raw_tokens += count_tokens(text)
+        words = set(_WORD_RE.findall(text.lower()))
+        span, merged = _place(spans, chunk, text, words, dedup_threshold)
+        if merged is None:
+            continue
+        merged_tokens = count_tokens(merged)
+        added = merged_tokens - (span.tokens if span is not None else 0)
+        if token_budget and tokens + added > token_budget:
+            continue
+        tokens += added
+        used.append(chunk)
+        if span is None:
+            spans.append(_Span(chunk, merged, words, merged_tokens))
+        else:
+            span.text = merged
+            span.words |= words
+            span.tokens = merged_tokens
+
+    context = "\n\n".join(span.text for span in spans)
+    context_tokens.observe(tokens)
+    context_tokens_total.inc(tokens)
+    context_tokens_saved.inc(max(raw_tokens - tokens, 0))
+    return context, tokens, used
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from rag.pdf_to_text import iter_pages
+from rag.chunking import chunk_body, chunk_documents
+from rag.jobs import counted
+from rag.embed_store import INDEX_TRAIN_SAMPLE, INDEX_TYPE, TRAINED_INDEX_TYPES, bump_index_version, embed_texts, make_index, train_index
+from rag.chunk_store import ChunkStore, ChunkStoreWriter, chunks_exist
+from rag.bm25 import BM25Builder, bm25_path, load_bm25
+
+# Index types that support removing vectors by id
+INCREMENTAL_INDEX_TYPES = ("flat", "flat-fp16", "pq", "ivf-flat", "ivf-pq")
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Content hash of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_corpus(corpus_dir, manifest):
+    """Map each PDF under corpus_dir to its (hash, size, mtime)
+
+    Files whose size and mtime match the manifest reuse the stored hash, so
+    an unchanged corpus is scanned without reading every document.
+    """
+    found = {}
+    known = manifest.get("documents", {})
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(".pdf"):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, corpus_dir)
+            stat = os.stat(path)
+            prev = known.get(rel)
+            if prev and prev["size"] == stat.st_size and prev["mtime"] == stat.st_mtime:
+                digest = prev["hash"]
+            else:
+                digest = file_sha256(path)
+            found[rel] = {"hash": digest, "size": stat.st_size, "mtime": stat.st_mtime}
+    return found
+
+
+def _write_atomic(path, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _load_state(index_path, meta_path, manifest_path):
+    import faiss
+
+    if not (os.path.exists(index_path) and chunks_exist(meta_path) and os.path.exists(manifest_path)):
+        return None, None, {"documents": {}, "next_id": 0}
+    index = faiss.read_index(index_path)
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return index, ChunkStore(meta_path), manifest
+
+
+def _no_progress(stage, n=1):
+    pass
+
+
+def ingest_corpus(corpus_dir, index_path, meta_path, manifest_path, index_type=INDEX_TYPE,
+                  source=None, progress=None):
+    """Bring the index in line with a directory of PDFs
+
+    Only new or changed documents are parsed and embedded; vectors of changed
+    and deleted documents are removed by id from an IndexIDMap2. The previous
+    state is read from source, an (index, meta, manifest) path triple that
+    defaults to the output paths, so a new version can be built to the side.
+    """
+    import faiss
+
+    if index_type not in INCREMENTAL_INDEX_TYPES:
+        raise ValueError(f"Index type {index_type!r} cannot remove vectors; use one of {INCREMENTAL_INDEX_TYPES}")
+    source_index, source_meta, source_manifest = source or (index_path, meta_path, manifest_path)
+    progress = progress or _no_progress
+
+    index, store, manifest = _load_state(source_index, source_meta, source_manifest)
+    documents = manifest["documents"]
+    found = scan_corpus(corpus_dir, manifest)
+
+    removed = [rel for rel in documents if rel not in found]
+    changed = [rel for rel in found if rel in documents and documents[rel]["hash"] != found[rel]["hash"]]
+    added = [rel for rel in found if rel not in documents]
+
+    # Drop vectors and chunks of deleted and changed documents
+    stale_ids = [i for rel in removed + changed for i in documents[rel]["ids"]]
+    if stale_ids and index is not None:
+        index.remove_ids(np.array(stale_ids, dtype="int64"))
+    for rel in removed:
+        del documents[rel]
+
+    stale = set(stale_ids)
+
+    # Update the BM25 postings instead of re-tokenizing the whole corpus
+    base = load_bm25(source_index) if store is not None else None
+    lexical = BM25Builder(base, stale_ids)
+    if base is None and store is not None:
+        # Corpus indexed before BM25 existed: tokenize the surviving chunks once
+        for chunk_id in store.ids():
+            if int(chunk_id) not in stale:
+                lexical.add(int(chunk_id), chunk_body(store[chunk_id]))
+
+    # A new IVF or PQ index is trained on up to INDEX_TRAIN_SAMPLE vectors
+    # buffered across documents, as in build_and_save_index_stream
+    pending_vectors, pending_ids = [], []
+
+    def build_from_pending():
+        nonlocal index
+        sample = np.vstack(pending_vectors)
+        index = faiss.IndexIDMap2(make_index(sample.shape[1], len(sample), index_type))
+        train_index(index, sample)
+        index.add_with_ids(sample, np.concatenate(pending_ids))
+        pending_vectors.clear()
+        pending_ids.clear()
+
+    def add_vectors(vectors, ids):
+        if index is not None:
+            index.add_with_ids(vectors, ids)
+            return
+        pending_vectors.append(vectors)
+        pending_ids.append(ids)
+        if index_type not in TRAINED_INDEX_TYPES or sum(len(v) for v in pending_vectors) >= INDEX_TRAIN_SAMPLE:
+            build_from_pending()
+
+    next_id = manifest["next_id"]
+    count = 0
+    with ChunkStoreWriter(meta_path) as writer:
+        # Copy surviving records byte-for-byte; new ids are all larger
+        if store is not None:
+            for chunk_id in store.ids():
+                if int(chunk_id) not in stale:
+                    writer.add_raw(store.raw(chunk_id), int(chunk_id))
+                    count += 1
+
+        # Records and postings of each new document are written as it finishes
+        docs = ((rel, counted(iter_pages(os.path.join(corpus_dir, rel)), progress, "pages"))
+                   for rel in changed + added)
+        for rel, doc_chunks in chunk_documents(docs):
+            progress("chunks", len(doc_chunks))
+            ids = list(range(next_id, next_id + len(doc_chunks)))
+            next_id += len(doc_chunks)
+            if doc_chunks:
+                vectors = embed_texts(doc_chunks)
+                progress("embedded", len(doc_chunks))
+                add_vectors(vectors, np.array(ids, dtype="int64"))
+                for chunk_id, chunk in zip(ids, doc_chunks):
+                    writer.add(chunk, chunk_id)
+                    lexical.add(chunk_id, chunk_body(chunk))
+                count += len(doc_chunks)
+            documents[rel] = dict(found[rel], ids=ids)
+            progress("documents")
+
+    if pending_vectors:
+        build_from_pending()
+
+    # Refresh size/mtime of unchanged documents so the next scan can skip hashing
+    for rel, info in found.items():
+        documents[rel].update(size=info["size"], mtime=info["mtime"])
+    manifest["next_id"] = next_id
+
+    if index is not None:
+        _write_atomic(index_path, lambda p: faiss.write_index(index, p))
+    lexical.build().save(bm25_path(index_path))
+
+    def write_manifest(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    _write_atomic(manifest_path, write_manifest)
+    bump_index_version(index_path)
+
+    return {
+        "added": len(added),
+        "updated": len(changed),
+        "removed": len(removed),
+        "unchanged": len(found) - len(added) - len(changed),
+        "chunks": count,
+    }
@@ -1,35 +1,273 @@
-import json
+import math
+import os
+import uuid
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
 
-# Local embedding model (free alternative to OpenAI embeddings)
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+from rag.embedder import encode, get_embedding_model, rss_bytes
+from rag.chunking import chunk_body
+from rag.chunk_store import ChunkStoreWriter, load_chunks, save_chunks
+from rag.bm25 import BM25Builder, bm25_path
+
+# Index type used by build_and_save_index: flat, flat-fp16, pq, hnsw, ivf-flat or ivf-pq
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "flat")
+# HNSW graph degree and build-time search depth
+INDEX_HNSW_M = int(os.environ.get("INDEX_HNSW_M", "32"))
+INDEX_EF_CONSTRUCTION = int(os.environ.get("INDEX_EF_CONSTRUCTION", "200"))
+# IVF list count (0 picks about 4 * sqrt(n)) and PQ code shape
+INDEX_NLIST = int(os.environ.get("INDEX_NLIST", "0"))
+# PQ sub-quantizers (0 picks about one per 8 dimensions, e.g. 48 for 384)
+INDEX_PQ_M = int(os.environ.get("INDEX_PQ_M", "0"))
+INDEX_PQ_NBITS = int(os.environ.get("INDEX_PQ_NBITS", "8"))
+# Maximum number of vectors used to train IVF/PQ indexes
+INDEX_TRAIN_SAMPLE = int(os.environ.get("INDEX_TRAIN_SAMPLE", "100000"))
+# Query-time accuracy/speed knobs applied by load_index
+INDEX_EF_SEARCH = int(os.environ.get("INDEX_EF_SEARCH", "64"))
+INDEX_NPROBE = int(os.environ.get("INDEX_NPROBE", "16"))
+
+# Memory-map the index file on load so workers share the OS page cache
+INDEX_MMAP = os.environ.get("INDEX_MMAP", "0") == "1"
+
+# Chunks embedded per encode call when building from a stream
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "256"))
+
+INDEX_TYPES = ("flat", "flat-fp16", "pq", "hnsw", "ivf-flat", "ivf-pq")
+# Index types that must be trained before vectors are added
+TRAINED_INDEX_TYPES = ("pq", "ivf-flat", "ivf-pq")
 
 def embed_texts(texts):
-    """Embed multiple texts using sentence-transformers"""
-    vectors = embedding_model.encode(
-        texts, 
-        convert_to_numpy=True, 
-        normalize_embeddings=True,
-        show_progress_bar=True
-    )
-    return vectors.astype('float32')
-
-def build_and_save_index(chunks, index_path, meta_path):
+    """Embed multiple texts (or chunk records) using the shared sentence-transformers model"""
+    return encode([chunk_body(t) for t in texts], show_progress_bar=True)
+
+def get_embedding_dim():
+    return get_embedding_model().get_sentence_embedding_dimension()
+
+def _min_train_size(index_type, nlist):
+    if index_type == "ivf-pq":
+        return max(nlist, 2 ** INDEX_PQ_NBITS)
+    if index_type == "pq":
+        return 2 ** INDEX_PQ_NBITS
+    if index_type == "ivf-flat":
+        return nlist
+    return 0
+
+def _nlist(n_vectors):
+    nlist = INDEX_NLIST or max(1, int(4 * math.sqrt(max(n_vectors, 1))))
+    return min(nlist, max(n_vectors, 1))
+
+def pq_m(dim):
+    """PQ sub-quantizer count: INDEX_PQ_M, or the largest divisor of dim up to dim / 8"""
+    if INDEX_PQ_M:
+        return INDEX_PQ_M
+    target = max(1, dim // 8)
+    return max(m for m in range(1, target + 1) if dim % m == 0)
+
+def built_index_type(n_vectors, index_type=INDEX_TYPE):
+    """Index type make_index actually builds; trained types fall back to flat below their training size"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    if n_vectors < _min_train_size(index_type, _nlist(n_vectors)):
+        return "flat"
+    return index_type
+
+def make_index(dim, n_vectors, index_type=INDEX_TYPE):
+    """Create an empty inner-product FAISS index of the given type
+
+    flat-fp16 stores half-precision vectors and pq stores PQ codes, both
+    searched exhaustively. Trained indexes fall back to flat when there are
+    too few vectors to train them (see built_index_type).
+    """
+    import faiss
+
+    index_type = built_index_type(n_vectors, index_type)
+    nlist = _nlist(n_vectors)
+
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "flat-fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "pq":
+        return faiss.IndexPQ(dim, pq_m(dim), INDEX_PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, INDEX_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = INDEX_EF_CONSTRUCTION
+        return index
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == "ivf-flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m(dim), INDEX_PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+
+def train_index(index, vectors, sample_size=INDEX_TRAIN_SAMPLE):
+    """Train the index on a random sample of vectors if it needs training"""
+    if index.is_trained:
+        return
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(0)
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    index.train(vectors)
+
+def set_search_params(index, ef_search=INDEX_EF_SEARCH, nprobe=INDEX_NPROBE):
+    """Apply efSearch (HNSW) or nprobe (IVF) to a loaded index"""
+    import faiss
+
+    params = faiss.ParameterSpace()
+    for name, value in (("efSearch", ef_search), ("nprobe", nprobe)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            # Parameter does not apply to this index type
+            pass
+    return index
+
+def build_index(vectors, index_type=INDEX_TYPE):
+    """Build and populate a FAISS index from normalized vectors"""
+    index = make_index(vectors.shape[1], len(vectors), index_type)
+    train_index(index, vectors)
+    index.add(vectors)
+    return index
+
+def _version_path(index_path):
+    return index_path + ".version"
+
+def bump_index_version(index_path):
+    """Stamp a freshly written index with a new unique version"""
+    version = uuid.uuid4().hex
+    tmp = _version_path(index_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, _version_path(index_path))
+    return version
+
+def read_index_version(index_path):
+    try:
+        with open(_version_path(index_path), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        # Index written before version stamps existed
+        return None
+
+def build_and_save_index(chunks, index_path, meta_path, index_type=INDEX_TYPE):
     """Build FAISS index and save it along with chunk metadata"""
+    import faiss
+
     vectors = embed_texts(chunks)
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(vectors)
+    index = build_index(vectors, index_type)
+    lexical = BM25Builder()
+    for i, chunk in enumerate(chunks):
+        lexical.add(i, chunk_body(chunk))
+
+    faiss.write_index(index, index_path)
+    save_chunks(meta_path, chunks)
+    lexical.build().save(bm25_path(index_path))
+    bump_index_version(index_path)
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def build_and_save_index_stream(chunk_iter, index_path, meta_path, index_type=INDEX_TYPE,
+                                batch_size=EMBED_BATCH_SIZE, progress=None):
+    """Embed and index chunks from an iterator, writing metadata as it goes
+
+    Chunks are embedded in batches of batch_size. IVF and PQ indexes buffer up
+    to INDEX_TRAIN_SAMPLE vectors for training before vectors are added. A
+    BM25 index over the same ids is built alongside. progress("embedded", n)
+    is called after each batch.
+    """
+    import faiss
+
+    index = None
+    lexical = BM25Builder()
+    pending = []
+    count = 0
+    with ChunkStoreWriter(meta_path) as writer:
+        for batch in _batches(chunk_iter, batch_size):
+            for chunk in batch:
+                writer.add(chunk)
+                lexical.add(count, chunk_body(chunk))
+                count += 1
+            vectors = encode([chunk_body(c) for c in batch])
+            if progress is not None:
+                progress("embedded", len(batch))
+            if index is None:
+                pending.append(vectors)
+                needs_training = index_type in TRAINED_INDEX_TYPES
+                if needs_training and sum(len(v) for v in pending) < INDEX_TRAIN_SAMPLE:
+                    continue
+                sample = np.vstack(pending)
+                index = make_index(sample.shape[1], len(sample), index_type)
+                train_index(index, sample)
+                for v in pending:
+                    index.add(v)
+                pending = []
+            else:
+                index.add(vectors)
 
+    if index is None:
+        sample = np.vstack(pending) if pending else np.zeros((0, get_embedding_dim()), dtype="float32")
+        index = build_index(sample, index_type)
     faiss.write_index(index, index_path)
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump({"chunks": chunks}, f, ensure_ascii=False, indent=2)
+    lexical.build().save(bm25_path(index_path))
+    bump_index_version(index_path)
+    return count
+
+def _mmap_flags():
+    """Read flags to try, best first
+
+    IO_FLAG_MMAP maps only the inverted lists of IVF indexes. FAISS releases
+    that have IO_FLAG_MMAP_IFC can also map the codes of flat, SQ and PQ
+    indexes.
+    """
+    import faiss
+
+    base = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return [base | ifc, base] if ifc else [base]
+
+def read_index(index_path, mmap=INDEX_MMAP):
+    """(index, mapped): read a FAISS index, memory-mapped when requested and supported
+
+    FAISS silently reads types it cannot map into the heap, so the result is
+    measured rather than assumed. A mapped read leaves resident memory almost
+    unchanged, and a heap read grows it by about the file size. mapped is
+    None when resident memory cannot be measured.
+    """
+    import faiss
+
+    if not mmap:
+        return faiss.read_index(index_path), False
+    size = os.path.getsize(index_path)
+    for flags in _mmap_flags():
+        before = rss_bytes()
+        try:
+            index = faiss.read_index(index_path, flags)
+        except RuntimeError:
+            continue
+        if not before:
+            return index, None
+        return index, rss_bytes() - before < size // 2
+    return faiss.read_index(index_path), False
+
+def index_memory_bytes(index):
+    """Bytes of stored vector codes (None if the index type does not expose them)"""
+    import faiss
+
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if hasattr(inner, "code_size"):
+        return int(inner.code_size) * int(inner.ntotal)
+    return None
 
 def load_index(index_path, meta_path):
-    """Load FAISS index and chunk metadata"""
-    index = faiss.read_index(index_path)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-    return index, meta["chunks"]
\ No newline at end of file
+    """Load FAISS index and chunk metadata
+
+    Chunks come back as a memory-mapped ChunkStore indexed by FAISS id, or
+    parsed from a legacy chunks.json. With INDEX_MMAP=1 the index file is
+    memory-mapped read-only instead of copied into the heap.
+    """
+    index, _ = read_index(index_path)
+    return set_search_params(index), load_chunks(meta_path)
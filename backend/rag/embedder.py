@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+# Name of the local sentence-transformers model shared by ingestion and retrieval
+EMBED_MODEL_NAME = os.environ.get("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+# "torch" (fp32 PyTorch), "onnx" (ONNX Runtime) or "onnx-int8" (dynamically quantized ONNX)
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+# CPU threads used inside one encode call (0 keeps the library default)
+EMBED_THREADS = int(os.environ.get("EMBED_THREADS", "0"))
+# Where exported and quantized ONNX models are kept
+EMBED_ONNX_DIR = os.environ.get("EMBED_ONNX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "onnx"))
+# Quantization preset for onnx-int8: avx2, avx512, avx512_vnni or arm64
+EMBED_QUANT_CONFIG = os.environ.get("EMBED_QUANT_CONFIG", "avx2")
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_model = None
+_lock = threading.Lock()
+_stats = {
+    "model": EMBED_MODEL_NAME,
+    "backend": EMBED_BACKEND,
+    "loaded": False,
+    "load_seconds": None,
+    "model_bytes": None,
+    "rss_delta_bytes": None,
+}
+
+
+def rss_bytes():
+    """Resident set size of the current process in bytes (0 if unknown)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _model_bytes(model, backend=EMBED_BACKEND):
+    """Size of the model weights held in memory (the .onnx file for ONNX backends)"""
+    if backend != "torch":
+        path = _onnx_file(model)
+        return os.path.getsize(path) if path and os.path.exists(path) else None
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _onnx_file(model):
+    return getattr(model[0].auto_model, "model_path", None)
+
+
+def _session_options(threads):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+def _export_dir(model_name=EMBED_MODEL_NAME):
+    return os.path.join(EMBED_ONNX_DIR, model_name.replace("/", "__"))
+
+
+def export_quantized(model_name=EMBED_MODEL_NAME, config=EMBED_QUANT_CONFIG):
+    """Export the model to ONNX and quantize it to int8 once; return (dir, file_name)"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    target = _export_dir(model_name)
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    if not os.path.exists(os.path.join(target, file_name)):
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        model.save(target)
+        export_dynamic_quantized_onnx_model(model, config, target)
+    return target, file_name
+
+
+def load_model(backend=EMBED_BACKEND, model_name=EMBED_MODEL_NAME, threads=EMBED_THREADS):
+    """Load a fresh SentenceTransformer on the given backend"""
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"EMBED_BACKEND must be one of {', '.join(EMBED_BACKENDS)}")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": _session_options(threads)}
+    if backend == "onnx-int8":
+        model_name, model_kwargs["file_name"] = export_quantized(model_name)
+    return SentenceTransformer(model_name, backend="onnx", device="cpu", model_kwargs=model_kwargs)
+
+
+def get_embedding_model():
+    """Return the process-wide embedding model, loading it on first use"""
+    global _model
+    if _model is not None:
+        return _model
+    with _lock:
+        if _model is None:
+            rss_before = rss_bytes()
+            started = time.perf_counter()
+            model = load_model()
+            _stats["load_seconds"] = round(time.perf_counter() - started, 3)
+            _stats["model_bytes"] = _model_bytes(model)
+            _stats["rss_delta_bytes"] = max(0, rss_bytes() - rss_before)
+            _stats["loaded"] = True
+            _model = model
+    return _model
+
+
+def encode(texts, show_progress_bar=False, model=None):
+    """Encode texts into normalized float32 vectors with the shared model"""
+    vectors = (model or get_embedding_model()).encode(
+        texts,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=show_progress_bar,
+    )
+    return vectors.astype('float32')
+
+
+def warm_up():
+    """Load the model and run one forward pass so the first request is not slow"""
+    get_embedding_model()
+    encode(["warm up"])
+    return embedding_stats()
+
+
+def embedding_stats():
+    """Load time and memory footprint of the shared embedding model"""
+    stats = dict(_stats)
+    stats["process_rss_bytes"] = rss_bytes()
+    return stats
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+
+from rag.bm25 import reciprocal_rank_fusion
+from rag.metrics import counter, histogram
+
+# "dense" uses FAISS only; "hybrid" fuses FAISS and BM25 results
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "dense")
+# Candidates taken from each retriever before fusion
+DENSE_K = int(os.environ.get("DENSE_K", "20"))
+LEXICAL_K = int(os.environ.get("LEXICAL_K", "20"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+# Time allowed for the BM25 side; past it, dense results are used alone
+LEXICAL_BUDGET_MS = float(os.environ.get("LEXICAL_BUDGET_MS", "20"))
+# BM25 searches queued or running at once; past it, queries use dense results alone
+LEXICAL_MAX_INFLIGHT = int(os.environ.get("LEXICAL_MAX_INFLIGHT", "8"))
+
+lexical_timeouts = counter("lexical_budget_exceeded_total", "Hybrid queries that fell back to dense-only")
+lexical_latency = histogram("lexical_search_seconds", "BM25 search time")
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+# Free places in the BM25 pool; taken on submit, given back when the search ends
+_inflight_slots = threading.BoundedSemaphore(max(1, LEXICAL_MAX_INFLIGHT))
+
+
+def hybrid_enabled(lexical):
+    return RETRIEVAL_MODE == "hybrid" and lexical is not None
+
+
+def _timed_search(lexical, query, k, deadline):
+    started = time.perf_counter()
+    if started > deadline:
+        # The caller already fell back to dense results while this was queued
+        return None
+    try:
+        return lexical.search(query, k)[0]
+    finally:
+        lexical_latency.observe(time.perf_counter() - started)
+
+
+def hybrid_ids(qvec, query, index, lexical, k, budget_ms=LEXICAL_BUDGET_MS):
+    """Top-k FAISS ids from dense and BM25 rankings merged by reciprocal rank fusion
+
+    Returns (ids, scores, fused), where scores are the dense similarities of
+    the ids (NaN for ids only BM25 found). BM25 runs in a worker thread while
+    FAISS searches; if it has not finished within budget_ms of the start, the
+    dense ranking is returned alone and fused is False.
+    """
+    started = time.perf_counter()
+    if not _inflight_slots.acquire(blocking=False):
+        # Abandoned searches are still running; don't queue behind them
+        lexical_timeouts.inc()
+        dense_scores, dense = index.search(qvec, k)
+        return dense[0], dense_scores[0], False
+    future = _pool.submit(_timed_search, lexical, query, LEXICAL_K, started + budget_ms / 1000.0)
+    future.add_done_callback(lambda _: _inflight_slots.release())
+    dense_scores, dense = index.search(qvec, max(k, DENSE_K))
+    remaining = budget_ms / 1000.0 - (time.perf_counter() - started)
+    try:
+        lexical_ids = future.result(timeout=max(0.0, remaining))
+    except FutureTimeout:
+        lexical_ids = None
+    if lexical_ids is None:
+        lexical_timeouts.inc()
+        return dense[0][:k], dense_scores[0][:k], False
+    ids = np.asarray(reciprocal_rank_fusion([dense[0], lexical_ids], k, RRF_K), dtype=np.int64)
+    by_id = dict(zip(dense[0].tolist(), dense_scores[0].tolist()))
+    return ids, np.array([by_id.get(int(i), np.nan) for i in ids], dtype="float32"), True
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs remembered in memory for progress queries
+JOBS_KEEP = int(os.environ.get("JOBS_KEEP", "20"))
+# Seconds between writes of a running job's progress to disk
+JOB_SAVE_INTERVAL = 1.0
+
+
+class Job:
+    """Progress of one background job
+
+    Stages are free-form counters such as pages, chunks and embedded. Status
+    goes queued -> running -> done | failed. When jobs_dir is set the job is
+    also written there, so any worker process can report on it.
+    """
+
+    def __init__(self, kind, jobs_dir=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "queued"
+        self.counts = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.jobs_dir = jobs_dir
+        self._saved = 0.0
+        self._lock = threading.Lock()
+
+    def progress(self, stage, n=1):
+        with self._lock:
+            self.counts[stage] = self.counts.get(stage, 0) + n
+        if time.monotonic() - self._saved > JOB_SAVE_INTERVAL:
+            self.save()
+
+    def to_dict(self):
+        with self._lock:
+            counts = dict(self.counts)
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": counts,
+            "throughput": {f"{stage}_per_second": round(n / elapsed, 2) if elapsed else 0.0
+                           for stage, n in counts.items()},
+            "elapsed_seconds": round(elapsed, 3),
+            "created": self.created,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    def save(self):
+        self._saved = time.monotonic()
+        if self.jobs_dir is None:
+            return
+        path = os.path.join(self.jobs_dir, f"{self.id}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+
+def counted(items, progress, stage):
+    """Pass items through, reporting each one to progress(stage)"""
+    for item in items:
+        progress(stage)
+        yield item
+
+
+class JobRunner:
+    """Runs jobs of one kind on a single background thread, one at a time"""
+
+    def __init__(self, kind, jobs_dir=None, keep=JOBS_KEEP):
+        self.kind = kind
+        self.jobs_dir = jobs_dir
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._active = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=kind)
+        if jobs_dir is not None:
+            os.makedirs(jobs_dir, exist_ok=True)
+
+    def submit(self, fn):
+        """Start fn(job) in the background; returns the job already active, if any"""
+        with self._lock:
+            if self._active is not None and self._active.status in ("queued", "running"):
+                return self._active, False
+            job = Job(self.kind, self.jobs_dir)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+            self._active = job
+        job.save()
+        self._prune_files()
+        self._pool.submit(self._run, job, fn)
+        return job, True
+
+    def _prune_files(self):
+        """Delete this runner's oldest finished job files past keep
+
+        JOBS_DIR is shared by every collection's runner and every worker, so
+        files of another kind, and jobs still queued or running, are left alone.
+        """
+        if self.jobs_dir is None:
+            return
+        finished = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                mtime = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            if saved.get("kind") == self.kind and saved.get("status") in ("done", "failed"):
+                finished.append((mtime, path))
+        finished.sort(reverse=True)
+        for _, path in finished[self.keep:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _run(self, job, fn):
+        job.status = "running"
+        job.started = time.time()
+        job.save()
+        try:
+            job.result = fn(job)
+            job.status = "done"
+        except Exception as exc:
+            job.error = str(exc) or type(exc).__name__
+            job.status = "failed"
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+            job.save()
+
+    def get(self, job_id):
+        """Status dict of a job, from memory or from another worker's job file"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return load_job(self.jobs_dir, job_id)
+
+
+def load_job(jobs_dir, job_id):
+    """Status dict of a job saved under jobs_dir, or None"""
+    if jobs_dir is None or not job_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(jobs_dir, f"{job_id}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,157 @@
+"""Versioned on-disk knowledge base and the in-memory snapshot served to requests.
+
+Every ingestion writes a complete index, chunk store, BM25 index and manifest
+into a fresh directory under data/versions/. Publishing replaces the
+data/CURRENT pointer with os.replace, so readers see the old version or the
+new one, never a mix of both. A request takes one KnowledgeBase snapshot and
+uses its index, chunks and lexical index together.
+"""
+import fcntl
+import os
+import shutil
+import time
+import uuid
+
+from rag.bm25 import bm25_path, load_bm25
+from rag.chunk_store import chunks_exist, load_chunks, migrate_json
+from rag.embed_store import bump_index_version, read_index, read_index_version, set_search_params
+
+# Published versions kept on disk; older ones are deleted after a publish
+KB_KEEP_VERSIONS = int(os.environ.get("KB_KEEP_VERSIONS", "2"))
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+META_FILE = "chunks.bin"
+MANIFEST_FILE = "manifest.json"
+LEGACY_CHUNKS_FILE = "chunks.json"
+MIGRATE_LOCK_FILE = ".migrate.lock"
+
+
+class KnowledgeBase:
+    """Index, chunk metadata and BM25 index of one published version"""
+
+    def __init__(self, version, index, chunks, lexical, index_version=None, memory_bytes=0, index_mapped=False):
+        self.version = version
+        self.index = index
+        self.chunks = chunks
+        self.lexical = lexical
+        # Stamp that keys cached search results for this index
+        self.index_version = index_version
+        self.memory_bytes = memory_bytes
+        # Whether the index file is memory-mapped (None if it could not be measured)
+        self.index_mapped = index_mapped
+
+    @classmethod
+    def load(cls, paths, version=None):
+        index, mapped = read_index(paths["index"])
+        index = set_search_params(index)
+        chunks = load_chunks(paths["meta"])
+        lexical = load_bm25(paths["index"])
+        # Heap bytes: the chunk store is always memory-mapped, the index only when the read was mapped
+        memory_bytes = 0 if mapped else os.path.getsize(paths["index"])
+        if lexical is not None:
+            memory_bytes += os.path.getsize(bm25_path(paths["index"]))
+        return cls(version, index, chunks, lexical, read_index_version(paths["index"]), memory_bytes, mapped)
+
+
+def version_paths(data_dir, version=None):
+    """File paths of a version; None is the unversioned layout directly in data_dir"""
+    root = data_dir if version is None else os.path.join(data_dir, VERSIONS_DIR, version)
+    return {
+        "dir": root,
+        "index": os.path.join(root, INDEX_FILE),
+        "meta": os.path.join(root, META_FILE),
+        "manifest": os.path.join(root, MANIFEST_FILE),
+    }
+
+
+def version_exists(paths):
+    return os.path.exists(paths["index"]) and chunks_exist(paths["meta"])
+
+
+def migrate_legacy(data_dir):
+    """Publish an unversioned index whose chunks are still in chunks.json
+
+    Runs at startup and before ingestion, not on the request path. A file
+    lock lets one process do the conversion while the others wait. The index
+    and the new chunk store are written into a fresh version directory and
+    published together through CURRENT.
+    """
+    legacy = version_paths(data_dir)
+    legacy_json = os.path.join(data_dir, LEGACY_CHUNKS_FILE)
+    if current_version(data_dir) is not None or chunks_exist(legacy["meta"]):
+        return
+    if not (os.path.exists(legacy["index"]) and os.path.exists(legacy_json)):
+        return
+    with open(os.path.join(data_dir, MIGRATE_LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if current_version(data_dir) is not None:
+                # Another process migrated while this one waited
+                return
+            version = new_version(data_dir)
+            paths = version_paths(data_dir, version)
+            try:
+                shutil.copy2(legacy["index"], paths["index"])
+                if os.path.exists(bm25_path(legacy["index"])):
+                    shutil.copy2(bm25_path(legacy["index"]), bm25_path(paths["index"]))
+                if os.path.exists(legacy["manifest"]):
+                    shutil.copy2(legacy["manifest"], paths["manifest"])
+                migrate_json(legacy_json, paths["meta"])
+                bump_index_version(paths["index"])
+            except Exception:
+                discard(data_dir, version)
+                raise
+            publish(data_dir, version)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def current_version(data_dir):
+    """Name of the published version, or None if nothing was published yet"""
+    try:
+        with open(os.path.join(data_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def new_version(data_dir):
+    """Create an empty directory for the next version and return its name"""
+    # Time prefix keeps versions sortable for pruning
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(version_paths(data_dir, version)["dir"])
+    return version
+
+
+def publish(data_dir, version, keep=KB_KEEP_VERSIONS):
+    """Atomically point data/CURRENT at version, then prune old versions"""
+    pointer = os.path.join(data_dir, CURRENT_FILE)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    prune_versions(data_dir, keep)
+
+
+def discard(data_dir, version):
+    """Delete an unpublished version, e.g. after a failed build"""
+    shutil.rmtree(version_paths(data_dir, version)["dir"], ignore_errors=True)
+
+
+def prune_versions(data_dir, keep=KB_KEEP_VERSIONS):
+    """Delete all but the newest `keep` versions, never the published one
+
+    Workers that still serve an older version keep their mapped files, since
+    removing a file does not unmap it.
+    """
+    root = os.path.join(data_dir, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return
+    current = current_version(data_dir)
+    versions = sorted(os.listdir(root), reverse=True)
+    for version in versions[max(keep, 1):]:
+        if version != current:
+            discard(data_dir, version)
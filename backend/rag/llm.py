@@ -0,0 +1,166 @@
+import asyncio
+import os
+import random
+
+from rag.metrics import counter
+
+# Maximum number of LLM calls in flight per worker
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+# Per-attempt timeout for one completion call
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "30"))
+# Retries after the first attempt for timeouts, rate limits and 5xx errors
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+# Base delay for exponential backoff between retries
+LLM_BACKOFF_SECONDS = float(os.environ.get("LLM_BACKOFF_SECONDS", "0.5"))
+
+prompt_tokens = counter("llm_prompt_tokens_total", "Prompt tokens sent to the LLM")
+completion_tokens = counter("llm_completion_tokens_total", "Completion tokens generated by the LLM")
+llm_retries = counter("llm_retries_total", "LLM calls retried after a transient error")
+llm_errors = counter("llm_errors_total", "LLM calls that failed after all retries")
+
+_async_client = None
+_semaphore = None
+_retryable_errors = None
+
+
+def retryable_errors():
+    """Timeouts, rate limits and 5xx errors; groq is imported on first use"""
+    global _retryable_errors
+    if _retryable_errors is None:
+        from groq import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+        _retryable_errors = (
+            APIConnectionError,
+            APITimeoutError,
+            InternalServerError,
+            RateLimitError,
+            asyncio.TimeoutError,
+        )
+    return _retryable_errors
+
+
+def get_async_client():
+    """Return the shared AsyncGroq client backed by a keep-alive connection pool
+
+    GROQ_BASE_URL may point the client at a local fake server for load tests.
+    """
+    global _async_client
+    if _async_client is None:
+        import httpx
+        from groq import AsyncGroq
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONCURRENCY * 2,
+                max_keepalive_connections=LLM_MAX_CONCURRENCY,
+                keepalive_expiry=60,
+            ),
+            timeout=LLM_TIMEOUT_SECONDS,
+        )
+        _async_client = AsyncGroq(
+            api_key=os.environ.get("GROQ_API_KEY"),
+            http_client=http_client,
+            max_retries=0,
+        )
+    return _async_client
+
+
+def get_semaphore():
+    """Semaphore bounding concurrent LLM calls in this worker"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def close_async_client():
+    """Close the shared client and forget it and the semaphore
+
+    Both are bound to the event loop they were first used on, so code that
+    runs its own loop with asyncio.run calls this before the loop closes.
+    """
+    global _async_client, _semaphore
+    client, _async_client, _semaphore = _async_client, None, None
+    if client is not None:
+        await client.close()
+
+
+def _backoff(attempt):
+    return LLM_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+
+
+def _count_usage(usage):
+    if usage is not None:
+        prompt_tokens.inc(usage.prompt_tokens or 0)
+        completion_tokens.inc(usage.completion_tokens or 0)
+
+
+async def chat_completion(**kwargs):
+    """Create a chat completion with bounded concurrency, timeout and retries"""
+    client = get_async_client()
+    retryable = retryable_errors()
+    attempt = 0
+    while True:
+        try:
+            async with get_semaphore():
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(**kwargs),
+                    timeout=LLM_TIMEOUT_SECONDS,
+                )
+            _count_usage(getattr(response, "usage", None))
+            return response
+        except retryable:
+            if attempt >= LLM_MAX_RETRIES:
+                llm_errors.inc()
+                raise
+            llm_retries.inc()
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+        except Exception:
+            llm_errors.inc()
+            raise
+
+
+async def stream_chat_completion(**kwargs):
+    """Yield content deltas from a streaming chat completion
+
+    Retries only apply before the first chunk arrives. Closing the generator
+    (for example when the HTTP client disconnects) closes the upstream stream.
+    """
+    client = get_async_client()
+    retryable = retryable_errors()
+    async with get_semaphore():
+        attempt = 0
+        while True:
+            try:
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(stream=True, **kwargs),
+                    timeout=LLM_TIMEOUT_SECONDS,
+                )
+                break
+            except retryable:
+                if attempt >= LLM_MAX_RETRIES:
+                    llm_errors.inc()
+                    raise
+                llm_retries.inc()
+                await asyncio.sleep(_backoff(attempt))
+                attempt += 1
+            except Exception:
+                llm_errors.inc()
+                raise
+        try:
+            async for chunk in stream:
+                # Groq reports token usage on the final chunk
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None:
+                    _count_usage(getattr(x_groq, "usage", None))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception:
+            llm_errors.inc()
+            raise
+        finally:
+            await stream.close()
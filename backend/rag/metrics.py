@@ -0,0 +1,112 @@
+import threading
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help = help_text
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Histogram:
+    """Cumulative bucket histogram with count and sum"""
+
+    def __init__(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, n in zip(self.buckets, self._counts):
+                cumulative += n
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self._count
+            return {"count": self._count, "sum": round(self._sum, 6), "buckets": buckets}
+
+
+def _get_or_create(cls, name, *args):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, *args)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name, help_text=""):
+    """Return the process-wide counter registered under name"""
+    return _get_or_create(Counter, name, help_text)
+
+
+def histogram(name, help_text="", buckets=LATENCY_BUCKETS):
+    """Return the process-wide histogram registered under name"""
+    return _get_or_create(Histogram, name, help_text, buckets)
+
+
+def snapshot():
+    """Current value of every registered metric"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name: m.snapshot() for m in metrics}
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(prefix="rag_"):
+    """Every registered metric in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        name = prefix + metric.name
+        if metric.help:
+            lines.append(f"# HELP {name} {metric.help}")
+        if isinstance(metric, Counter):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {_format(metric.value)}")
+            continue
+        snap = metric.snapshot()
+        lines.append(f"# TYPE {name} histogram")
+        for bound, count in snap["buckets"].items():
+            lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{name}_sum {_format(snap['sum'])}")
+        lines.append(f"{name}_count {snap['count']}")
+    return "\n".join(lines) + "\n"
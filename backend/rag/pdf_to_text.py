@@ -1,11 +1,65 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 from pypdf import PdfReader
 
-def pdf_to_text(pdf_path: str) -> str:
-    reader = PdfReader(pdf_path)
-    pages = []
-    for page in reader.pages:
-        pages.append(page.extract_text() or "")
-    text = "\n".join(pages)
+# Worker processes used for page extraction (1 extracts in-process)
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to a worker per task
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "8"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Return the process-wide extraction pool, created on first use"""
+    global _pool
+    if _pool is not None:
+        return _pool
+    # Ingest jobs of different collections can ask for it at the same time
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps the workers free of the server's threads and loaded models
+            _pool = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _clean(text):
     text = text.replace("\r", "\n")
-    text = "\n".join([line.strip() for line in text.split("\n") if line.strip()])
-    return text
\ No newline at end of file
+    return "\n".join(line.strip() for line in text.split("\n") if line.strip())
+
+def _extract_range(pdf_path, start, stop):
+    """Extract and clean pages [start, stop) of a PDF"""
+    reader = PdfReader(pdf_path)
+    return [(i + 1, _clean(reader.pages[i].extract_text() or "")) for i in range(start, stop)]
+
+def iter_pages(pdf_path: str, workers: int = PDF_WORKERS):
+    """Yield (page_number, text) for each page, in order, as pages are extracted
+
+    Pages are extracted in a process pool; at most two tasks per worker are in
+    flight, so memory stays bounded however large the document is.
+    """
+    num_pages = len(PdfReader(pdf_path).pages)
+    if workers <= 1 or num_pages <= PDF_PAGES_PER_TASK:
+        for start in range(0, num_pages, PDF_PAGES_PER_TASK):
+            yield from _extract_range(pdf_path, start, min(start + PDF_PAGES_PER_TASK, num_pages))
+        return
+
+    pool = _get_pool()
+    ranges = iter(range(0, num_pages, PDF_PAGES_PER_TASK))
+    pending = deque()
+    for start in ranges:
+        pending.append(pool.submit(_extract_range, pdf_path, start, min(start + PDF_PAGES_PER_TASK, num_pages)))
+        if len(pending) >= workers * 2:
+            break
+    while pending:
+        pages = pending.popleft().result()
+        start = next(ranges, None)
+        if start is not None:
+            pending.append(pool.submit(_extract_range, pdf_path, start, min(start + PDF_PAGES_PER_TASK, num_pages)))
+        yield from pages
+
+def pdf_to_text(pdf_path: str) -> str:
+    return "\n".join(text for _, text in iter_pages(pdf_path) if text)
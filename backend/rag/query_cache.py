@@ -0,0 +1,145 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rag.embedder import EMBED_BACKEND, EMBED_MODEL_NAME
+from rag.metrics import counter
+
+# Entries kept in each worker's LRU (0 disables the cache)
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "10000"))
+# Optional Redis URL for a cache shared by all workers, e.g. redis://localhost:6379/0
+QUERY_CACHE_REDIS_URL = os.environ.get("QUERY_CACHE_REDIS_URL")
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get("QUERY_CACHE_TTL_SECONDS", "86400"))
+
+vector_hits = counter("query_cache_vector_hits_total", "Query embeddings served from cache")
+vector_misses = counter("query_cache_vector_misses_total", "Query embeddings computed")
+result_hits = counter("query_cache_result_hits_total", "Top-k id lists served from cache")
+result_misses = counter("query_cache_result_misses_total", "Top-k id lists searched in FAISS")
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace; the embedding model is uncased"""
+    return " ".join(query.lower().split())
+
+
+class LRUBackend:
+    """Bounded in-process LRU of bytes values"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Cache shared across workers through Redis (needs the redis package)"""
+
+    def __init__(self, url, ttl_seconds=QUERY_CACHE_TTL_SECONDS, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl_seconds
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value):
+        self.client.set(key, value, ex=self.ttl)
+
+
+class QueryCache:
+    """Cache of query vectors and top-k FAISS ids
+
+    Vectors are keyed by model and normalized query. Id lists are also keyed
+    by the index version stamp, so a rebuilt index never serves stale ids.
+    Lookups go to the in-process LRU first, then the optional shared backend.
+    """
+
+    def __init__(self, local, shared=None, model_name=f"{EMBED_MODEL_NAME}:{EMBED_BACKEND}"):
+        self.local = local
+        self.shared = shared
+        self.model_name = model_name
+
+    def _get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def _set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    @staticmethod
+    def _digest(query):
+        return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+    def get_vector(self, query):
+        value = self._get(f"qv:{self.model_name}:{self._digest(query)}")
+        if value is None:
+            vector_misses.inc()
+            return None
+        vector_hits.inc()
+        return np.frombuffer(value, dtype="float32").reshape(1, -1)
+
+    def put_vector(self, query, qvec):
+        self._set(f"qv:{self.model_name}:{self._digest(query)}", np.asarray(qvec, dtype="float32").tobytes())
+
+    def get_ids(self, query, k, version=None, mode="dense"):
+        """Cached (ids, scores) for the query on the given index version
+
+        Indexes without a version stamp (written before stamps existed) are
+        never cached, since their ids could not be told apart from another
+        index's.
+        """
+        if version is None:
+            return None
+        value = self._get(f"qs:{version}:{mode}:{k}:{self._digest(query)}")
+        if value is None:
+            result_misses.inc()
+            return None
+        result_hits.inc()
+        # ids as int64 followed by their scores as float64
+        n = len(value) // 16
+        return np.frombuffer(value, dtype="int64", count=n), np.frombuffer(value, dtype="float64", offset=n * 8)
+
+    def put_ids(self, query, k, ids, scores, version=None, mode="dense"):
+        if version is not None:
+            value = np.asarray(ids, dtype="int64").tobytes() + np.asarray(scores, dtype="float64").tobytes()
+            self._set(f"qs:{version}:{mode}:{k}:{self._digest(query)}", value)
+
+
+def _make_cache():
+    if QUERY_CACHE_SIZE <= 0:
+        return None
+    shared = RedisBackend(QUERY_CACHE_REDIS_URL) if QUERY_CACHE_REDIS_URL else None
+    return QueryCache(LRUBackend(QUERY_CACHE_SIZE), shared)
+
+
+query_cache = _make_cache()
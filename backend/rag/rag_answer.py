@@ -1,37 +1,189 @@
+import asyncio
 import numpy as np
-from groq import Groq
-import faiss
-from sentence_transformers import SentenceTransformer
 import os
 
-# Initialize Groq client
-client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+from rag.embedder import encode
+from rag.batching import get_batcher
+from rag.context import build_context
+from rag.query_cache import query_cache
+from rag.hybrid import hybrid_enabled, hybrid_ids
+from rag.rerank import RERANK_ENABLED, candidates_k, rerank
+from rag.llm import chat_completion, close_async_client, stream_chat_completion
+from rag.metrics import counter, histogram
+from rag.tracing import span
 
 # Groq model
 CHAT_MODEL = "llama-3.3-70b-versatile"
 
-# Local embedding model (free alternative to OpenAI embeddings)
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+# Number of chunks retrieved per question
+RETRIEVE_K = int(os.environ.get("RETRIEVE_K", "4"))
+
+# LLM calls in flight for one batch of questions
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+# Similarity the best dense hit must reach for the question to go to the LLM (0 disables)
+RETRIEVE_MIN_SCORE = float(os.environ.get("RETRIEVE_MIN_SCORE", "0"))
+
+# Answer given without an LLM call when nothing relevant was retrieved
+HANDOFF_ANSWER = (
+    "I don't have information about that in our policy documents. "
+    "Would you like me to connect you with a member of our customer care team?"
+)
+
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+best_score_hist = histogram("retrieval_best_score", "Similarity of the best dense hit per question", SCORE_BUCKETS)
+handoffs = counter("retrieval_handoffs_total", "Questions given the human-support handoff without an LLM call")
 
 def embed_query(query: str):
-    """Embed a single query using sentence-transformers"""
-    vec = embedding_model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
-    return vec.astype('float32')
-
-def retrieve(query, index, chunks, k=4):
-    """Retrieve top-k relevant chunks for the query"""
-    qvec = embed_query(query)
-    scores, ids = index.search(qvec, k)
-    results = []
-    for i in ids[0]:
+    """Embed a single query, batched with concurrent queries when enabled"""
+    if query_cache is not None:
+        cached = query_cache.get_vector(query)
+        if cached is not None:
+            return cached
+    batcher = get_batcher()
+    with span("embed_query"):
+        if batcher is None:
+            qvec = encode([query])
+        else:
+            qvec = batcher.embed(query)
+    if query_cache is not None:
+        query_cache.put_vector(query, qvec)
+    return qvec
+
+def _mode(query, lexical):
+    return "hybrid" if query is not None and hybrid_enabled(lexical) else "dense"
+
+def _cached_ids(query, k, version=None, lexical=None):
+    if query is None or query_cache is None:
+        return None
+    return query_cache.get_ids(query, k, version, _mode(query, lexical))
+
+def _search_ids(qvec, index, k, query=None, lexical=None, version=None):
+    """(ids, dense similarity scores) of the top-k candidates"""
+    mode = _mode(query, lexical)
+    complete = True
+    with span("search"):
+        if mode == "hybrid":
+            ids, scores, complete = hybrid_ids(qvec, query, index, lexical, k)
+        else:
+            found_scores, found = index.search(qvec, k)
+            ids, scores = found[0], found_scores[0]
+    # A dense-only fallback after a BM25 timeout is not what the query should get next time
+    if complete and query is not None and query_cache is not None:
+        query_cache.put_ids(query, k, ids, scores, version, mode)
+    return ids, scores
+
+def _scored_chunks(ids, scores, chunks):
+    """(chunks, scores) for the ids the index returned; -1 marks an empty slot"""
+    hits, kept = [], []
+    for i, score in zip(ids, scores):
         if i != -1:
-            results.append(chunks[i])
-    return results
+            hits.append(chunks[i])
+            kept.append(float(score))
+    return hits, kept
+
+def _best(scores):
+    """Highest dense score, ignoring the NaN of hits only BM25 found"""
+    finite = [score for score in scores if score == score]
+    return max(finite) if finite else None
+
+def _top_hits(query, hits, scores, k):
+    """Rerank the candidates when enabled, otherwise keep the index order; scores stay with their hits"""
+    if RERANK_ENABLED:
+        with span("rerank"):
+            top = rerank(query, hits, k)
+        by_hit = {id(hit): score for hit, score in zip(hits, scores)}
+        return top, [by_hit[id(hit)] for hit in top]
+    return hits[:k], scores[:k]
+
+def _ranked(query, ids, scores, chunks, k):
+    hits, scores = _scored_chunks(ids, scores, chunks)
+    best = _best(scores)
+    if best is not None:
+        best_score_hist.observe(best)
+    top, top_scores = _top_hits(query, hits, scores, k)
+    return top, top_scores, best
+
+def retrieve_scored(query, index, chunks, k=RETRIEVE_K, lexical=None, version=None, qvec=None):
+    """Top-k chunks with their scores, plus the best score among all candidates
+
+    Returns (hits, scores, best_score). Scores are inner products of
+    normalized vectors, i.e. cosine similarity; a hit only BM25 found scores
+    NaN. best_score is None when the index returned nothing. Pass qvec when
+    the query is already embedded.
+    """
+    n = candidates_k(k)
+    found = _cached_ids(query, n, version, lexical)
+    if found is None:
+        if qvec is None:
+            qvec = embed_query(query)
+        found = _search_ids(qvec, index, n, query, lexical, version)
+    ids, scores = found
+    return _ranked(query, ids, scores, chunks, k)
+
+def retrieve(query, index, chunks, k=RETRIEVE_K, lexical=None, version=None):
+    """Retrieve top-k relevant chunks for the query
+
+    With a BM25 index in hybrid mode, dense and lexical results are fused;
+    with reranking enabled, more candidates are fetched and rescored.
+    """
+    hits, _, _ = retrieve_scored(query, index, chunks, k, lexical, version)
+    return hits
+
+def retrieve_many_scored(queries, index, chunks, k=RETRIEVE_K, lexical=None):
+    """(hits, scores, best_score) for many queries with one encode and one search"""
+    queries = list(queries)
+    with span("embed_query"):
+        qvecs = encode(queries)
+    n = candidates_k(k)
+    with span("search"):
+        if hybrid_enabled(lexical):
+            rows = [hybrid_ids(qvecs[i:i + 1], q, index, lexical, n)[:2] for i, q in enumerate(queries)]
+        else:
+            scores, ids = index.search(qvecs, n)
+            rows = list(zip(ids, scores))
+    return [_ranked(q, row_ids, row_scores, chunks, k) for q, (row_ids, row_scores) in zip(queries, rows)]
+
+def is_answerable(best_score, min_score=RETRIEVE_MIN_SCORE):
+    """Whether retrieval found anything close enough to the question to send it to the LLM"""
+    return min_score <= 0 or (best_score is not None and best_score >= min_score)
 
-def generate_answer(user_question, retrieved_chunks):
-    """Generate answer using Groq's LLM"""
-    context = "\n\n".join(retrieved_chunks)
+def handoff():
+    """The canned human-support answer, given instead of an LLM call"""
+    handoffs.inc()
+    return {"answer": HANDOFF_ANSWER, "citations": [], "handoff": True}
 
+def citations(retrieved_chunks):
+    """Document, page and section of each chunk that carries them
+
+    Pass the chunks prompt_context used, so hits dropped as duplicates or
+    over the token budget are not cited.
+    """
+    cited = []
+    for chunk in retrieved_chunks:
+        if isinstance(chunk, dict):
+            source = {"doc": chunk.get("doc"), "page": chunk.get("page"), "section": chunk.get("section")}
+            if source not in cited:
+                cited.append(source)
+    return cited
+
+def prompt_context(retrieved_chunks):
+    """(context text, chunks it used) for the prompt
+
+    Overlapping hits are merged and the context is capped at
+    CONTEXT_TOKEN_BUDGET tokens (see rag.context).
+    """
+    with span("prompt"):
+        context, _, used = build_context(retrieved_chunks)
+    return context, used
+
+def build_messages(user_question, context, history=None):
+    """Build the system and user messages for the LLM
+
+    context is the text from prompt_context. history is a session's
+    (summary, recent turns) pair, sent ahead of the question.
+    """
     # Create the prompt for Groq
     system_message = (
         "You are an Insurance Agency Customer Care assistant. "
@@ -41,15 +193,85 @@ def generate_answer(user_question, retrieved_chunks):
     
     user_message = f"Context:\n{context}\n\nQuestion:\n{user_question}"
 
-    # Call Groq API
-    response = client.chat.completions.create(
+    messages = [{"role": "system", "content": system_message}]
+    if history is not None:
+        summary, turns = history
+        if summary:
+            messages.append({"role": "system", "content": f"Earlier in this conversation:\n{summary}"})
+        for question, answer in turns:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+async def generate_answer_async(user_question, context, history=None):
+    """Generate answer using Groq's LLM without blocking the event loop"""
+    messages = build_messages(user_question, context, history)
+    with span("llm"):
+        response = await chat_completion(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1024,
+        )
+
+    return response.choices[0].message.content
+
+def stream_answer(user_question, context, history=None):
+    """Async generator of answer tokens from Groq's LLM as they are generated"""
+    return stream_chat_completion(
         model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": user_message}
-        ],
+        messages=build_messages(user_question, context, history),
         temperature=0.7,
         max_tokens=1024,
     )
-    
-    return response.choices[0].message.content
\ No newline at end of file
+
+async def answer_many(questions, index, chunks, concurrency=BATCH_CONCURRENCY, lexical=None):
+    """Answer many questions, yielding one result dict per question in input order
+
+    Retrieval runs once for the whole batch; at most `concurrency` LLM calls
+    are in flight, and later answers are generated while earlier ones are sent.
+    Questions with nothing relevant retrieved get the handoff answer.
+    """
+    questions = list(questions)
+
+    def retrieve_contexts():
+        # (context, used chunks) per question, or None when it gets the handoff
+        rows = retrieve_many_scored(questions, index, chunks, RETRIEVE_K, lexical)
+        return [prompt_context(hits) if is_answerable(best) else None for hits, _, best in rows]
+
+    contexts = await asyncio.to_thread(retrieve_contexts)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(question, context):
+        async with semaphore:
+            return await generate_answer_async(question, context)
+
+    tasks = [asyncio.ensure_future(answer(q, found[0])) if found is not None else None
+             for q, found in zip(questions, contexts)]
+    try:
+        for i, (question, task) in enumerate(zip(questions, tasks)):
+            if task is None:
+                yield {"index": i, "question": question, **handoff()}
+                continue
+            result = {"index": i, "question": question, "citations": citations(contexts[i][1])}
+            try:
+                result["answer"] = await task
+            except Exception as exc:
+                result["error"] = str(exc) or type(exc).__name__
+            yield result
+    finally:
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+
+def answer_batch(questions, index, chunks, concurrency=BATCH_CONCURRENCY, lexical=None):
+    """Blocking wrapper around answer_many for scripts and offline evaluation"""
+    async def collect():
+        try:
+            return [result async for result in answer_many(questions, index, chunks, concurrency, lexical)]
+        finally:
+            # The LLM client belongs to this call's event loop
+            await close_async_client()
+
+    return asyncio.run(collect())
@@ -0,0 +1,181 @@
+"""Named collections (one knowledge base per tenant) loaded on demand.
+
+The default collection lives directly in data/; a named collection lives in
+COLLECTIONS_DIR/<name>/ with the same versioned layout, and its PDFs in
+COLLECTIONS_DIR/<name>/docs/. Loaded collections are kept in an LRU whose
+total index size stays under COLLECTIONS_MAX_MB; evicted collections are
+reloaded from disk on their next request (for index types FAISS can map
+with INDEX_MMAP=1, that is mostly page-cache hits).
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from rag.answer_cache import cache_for
+from rag.knowledge_base import KnowledgeBase, current_version, version_exists, version_paths
+from rag.metrics import Histogram
+
+DEFAULT_COLLECTION = "default"
+# Directory holding one sub-directory per named collection
+COLLECTIONS_DIR = os.environ.get(
+    "COLLECTIONS_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "collections")
+)
+# Memory ceiling for resident collection indexes; least recently used ones are unloaded past it
+COLLECTIONS_MAX_MB = float(os.environ.get("COLLECTIONS_MAX_MB", "2048"))
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class CollectionStats:
+    """Load, hit and request latency figures of one collection"""
+
+    def __init__(self, name):
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.last_load_seconds = None
+        self.hits = 0
+        self.evictions = 0
+        self.latency = Histogram(f"collection_{name}_request_seconds")
+
+    def snapshot(self):
+        return {
+            "loads": self.loads,
+            "load_seconds": round(self.load_seconds, 3),
+            "last_load_seconds": self.last_load_seconds,
+            "hits": self.hits,
+            "evictions": self.evictions,
+            "request_seconds": self.latency.snapshot(),
+        }
+
+
+class CollectionRegistry:
+    def __init__(self, data_dir, collections_dir=COLLECTIONS_DIR, max_bytes=int(COLLECTIONS_MAX_MB * 1024 * 1024)):
+        self.default_dir = data_dir
+        self.collections_dir = collections_dir
+        self.max_bytes = max_bytes
+        self._resident = OrderedDict()  # name -> KnowledgeBase
+        self._versions = {}  # name -> last version served, to spot new publishes
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def validate(self, name):
+        """Collection name to use, or ValueError for names that are not safe paths"""
+        name = name or DEFAULT_COLLECTION
+        if not _NAME_RE.match(name):
+            raise ValueError("Collection names may only use letters, digits, '-' and '_'")
+        return name
+
+    def data_dir(self, name):
+        name = self.validate(name)
+        if name == DEFAULT_COLLECTION:
+            return self.default_dir
+        return os.path.join(self.collections_dir, name)
+
+    def docs_dir(self, name):
+        return os.path.join(self.data_dir(name), "docs")
+
+    def _stats_for(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = CollectionStats(name)
+        return stats
+
+    def resident(self, name):
+        """The loaded, up-to-date knowledge base of a collection, or None"""
+        name = self.validate(name)
+        kb = self._resident.get(name)
+        if kb is None or kb.version != current_version(self.data_dir(name)):
+            return None
+        with self._lock:
+            if name in self._resident:
+                self._resident.move_to_end(name)
+            self._stats_for(name).hits += 1
+        return kb
+
+    def exists(self, name):
+        """Whether a collection has a published version or a legacy index on disk"""
+        data_dir = self.data_dir(name)
+        return current_version(data_dir) is not None or os.path.exists(version_paths(data_dir)["index"])
+
+    def load(self, name):
+        """Load the published version of a collection; None if it was never ingested
+
+        Names that were never ingested leave nothing behind (no lock, stats
+        or cache), so arbitrary client-supplied names cannot grow the registry.
+        """
+        name = self.validate(name)
+        if not self.exists(name):
+            return None
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            kb = self.resident(name)
+            if kb is not None:
+                return kb
+            data_dir = self.data_dir(name)
+            version = current_version(data_dir)
+            paths = version_paths(data_dir, version)
+            if not version_exists(paths):
+                return None
+            started = time.perf_counter()
+            kb = KnowledgeBase.load(paths, version)
+            with self._lock:
+                stats = self._stats_for(name)
+                stats.loads += 1
+                stats.last_load_seconds = round(time.perf_counter() - started, 3)
+                stats.load_seconds += stats.last_load_seconds
+            self.install(name, kb)
+            return kb
+
+    def install(self, name, kb):
+        """Make kb the served version of a collection and enforce the memory ceiling"""
+        name = self.validate(name)
+        with self._lock:
+            replaced = name in self._versions and self._versions[name] != kb.version
+            self._versions[name] = kb.version
+            self._resident[name] = kb
+            self._resident.move_to_end(name)
+            while len(self._resident) > 1 and self.resident_bytes() > self.max_bytes:
+                evicted, _ = self._resident.popitem(last=False)
+                self._stats_for(evicted).evictions += 1
+        if replaced:
+            # A new version was published; cached answers may be stale
+            cache = self.answer_cache(name)
+            if cache is not None:
+                cache.clear()
+
+    def answer_cache(self, name):
+        """Answer cache of a collection (None when answer caching is disabled)"""
+        name = self.validate(name)
+        return cache_for(None if name == DEFAULT_COLLECTION else name)
+
+    def resident_bytes(self):
+        return sum(kb.memory_bytes for kb in self._resident.values())
+
+    def observe(self, name, seconds):
+        """Record the latency of one request served from a collection"""
+        name = self.validate(name)
+        with self._lock:
+            stats = self._stats_for(name)
+        stats.latency.observe(seconds)
+
+    def stats(self):
+        with self._lock:
+            names = sorted(set(self._stats) | set(self._resident))
+            return {
+                "resident_bytes": self.resident_bytes(),
+                "max_bytes": self.max_bytes,
+                "collections": {
+                    name: {
+                        "resident": name in self._resident,
+                        "version": self._versions.get(name),
+                        "memory_bytes": self._resident[name].memory_bytes if name in self._resident else None,
+                        "index_mapped": self._resident[name].index_mapped if name in self._resident else None,
+                        **self._stats_for(name).snapshot(),
+                    }
+                    for name in names
+                },
+            }
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+
+from rag.chunking import chunk_body
+from rag.metrics import counter, histogram
+from rag.query_cache import LRUBackend, normalize_query
+
+# Rerank FAISS candidates with a local cross-encoder (0 disables)
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_NAME = os.environ.get("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched from the index and scored per question
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", "16"))
+# Time allowed for reranking one question; past it, dense order is kept
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "150"))
+# Questions queued or scoring at once; past it, new questions keep dense order
+RERANK_MAX_QUEUE = int(os.environ.get("RERANK_MAX_QUEUE", "4"))
+# (query, chunk) scores kept in memory (0 disables the cache)
+RERANK_CACHE_SIZE = int(os.environ.get("RERANK_CACHE_SIZE", "50000"))
+
+rerank_timeouts = counter("rerank_budget_exceeded_total", "Questions that fell back to dense order")
+rerank_cache_hits = counter("rerank_cache_hits_total", "Rerank scores served from cache")
+rerank_latency = histogram("rerank_seconds", "Cross-encoder scoring time per question")
+
+_model = None
+_lock = threading.Lock()
+# One scorer thread: torch already uses every core for a batch
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+# Free places in the scorer's queue; taken on submit, given back when the job ends
+_queue_slots = threading.BoundedSemaphore(max(1, RERANK_MAX_QUEUE))
+_cache = LRUBackend(RERANK_CACHE_SIZE) if RERANK_CACHE_SIZE > 0 else None
+
+
+def candidates_k(k):
+    """Number of index hits to fetch so reranking has candidates to choose from"""
+    return max(k, RERANK_CANDIDATES) if RERANK_ENABLED else k
+
+
+def get_rerank_model():
+    """Return the process-wide cross-encoder, loading it on first use"""
+    global _model
+    if _model is not None:
+        return _model
+    with _lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+
+            _model = CrossEncoder(RERANK_MODEL_NAME, device="cpu")
+    return _model
+
+
+def _key(query, text):
+    digest = hashlib.sha1(normalize_query(query).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def score(query, texts, deadline=None, batch_size=RERANK_BATCH_SIZE):
+    """Cross-encoder relevance of each text to the query, or None past the deadline"""
+    if deadline is not None and time.perf_counter() > deadline:
+        # The caller already gave up while this job was queued
+        return None
+    keys = [_key(query, t) for t in texts]
+    scores = np.empty(len(texts), dtype=np.float32)
+    missing = []
+    for i, key in enumerate(keys):
+        cached = _cache.get(key) if _cache is not None else None
+        if cached is None:
+            missing.append(i)
+        else:
+            scores[i] = cached
+            rerank_cache_hits.inc()
+
+    model = get_rerank_model()
+    for start in range(0, len(missing), batch_size):
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+        batch = missing[start:start + batch_size]
+        batch_scores = model.predict([(query, texts[i]) for i in batch], batch_size=batch_size)
+        for i, value in zip(batch, batch_scores):
+            scores[i] = float(value)
+            if _cache is not None:
+                _cache.set(keys[i], float(value))
+    return scores
+
+
+def rerank(query, hits, k, budget_ms=RERANK_BUDGET_MS):
+    """Best k hits by cross-encoder score, or the dense top-k if over budget"""
+    if len(hits) <= 1:
+        return hits[:k]
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000.0
+    if not _queue_slots.acquire(blocking=False):
+        # The scorer is backed up; waiting would only use up the budget
+        rerank_timeouts.inc()
+        return hits[:k]
+    future = _pool.submit(score, query, [chunk_body(h) for h in hits], deadline)
+    future.add_done_callback(lambda _: _queue_slots.release())
+    try:
+        scores = future.result(timeout=max(deadline - time.perf_counter(), 0))
+    except FutureTimeout:
+        scores = None
+    if scores is None:
+        rerank_timeouts.inc()
+        return hits[:k]
+    rerank_latency.observe(time.perf_counter() - started)
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [hits[i] for i in order]
+
+
+def warm_up():
+    """Load the cross-encoder and score one pair"""
+    if RERANK_ENABLED:
+        get_rerank_model().predict([("warm up", "warm up")])
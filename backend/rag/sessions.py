@@ -0,0 +1,236 @@
+"""Server-side chat sessions with a token-bounded history.
+
+A session keeps its latest turns verbatim within SESSION_HISTORY_TOKENS.
+Older turns are folded into a short extractive summary (the question and the
+first sentence of its answer) that is capped at SESSION_SUMMARY_TOKENS, so
+no session holds more than about history + summary tokens of text however
+long the conversation runs. Sessions expire after SESSION_TTL_SECONDS idle,
+and the least recently used ones are evicted past SESSION_MAX_SESSIONS.
+"""
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+from rag.chunking import get_encoder
+from rag.llm import chat_completion
+from rag.metrics import counter
+
+# Idle time after which a session is forgotten
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", "1800"))
+# Sessions kept per worker; least recently used ones are evicted past it
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "10000"))
+# Tokens of recent turns kept verbatim and sent with each question
+SESSION_HISTORY_TOKENS = int(os.environ.get("SESSION_HISTORY_TOKENS", "600"))
+# Tokens of summary kept for turns that no longer fit the history
+SESSION_SUMMARY_TOKENS = int(os.environ.get("SESSION_SUMMARY_TOKENS", "200"))
+# How follow-ups become standalone retrieval queries: heuristic or llm
+SESSION_CONDENSE = os.environ.get("SESSION_CONDENSE", "heuristic")
+# Small model that rewrites follow-ups when SESSION_CONDENSE=llm
+CONDENSE_MODEL = os.environ.get("CONDENSE_MODEL", "llama-3.1-8b-instant")
+# Messages longer than this are treated as standalone questions
+FOLLOW_UP_MAX_WORDS = 12
+# A message with a pronoun and at most this many content words leans on earlier turns
+FOLLOW_UP_MAX_CONTENT_WORDS = 1
+# Words of the previous query carried into a condensed follow-up
+CONDENSE_CARRY_WORDS = 40
+
+sessions_created = counter("sessions_created_total", "Chat sessions started")
+sessions_evicted = counter("sessions_evicted_total", "Sessions dropped by the TTL or the session limit")
+follow_ups_condensed = counter("session_follow_ups_condensed_total", "Follow-up messages rewritten as standalone queries")
+
+_FOLLOW_UP_RE = re.compile(r"^(and|also|or|but|so|what about|how about|what if|same)\b", re.IGNORECASE)
+_PRONOUN_RE = re.compile(r"\b(it|its|that|this|those|these|they|them|their|one|ones)\b", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z]+")
+# Words that carry no topic of their own; anything else counts as a content word
+_FUNCTION_WORDS = frozenset("""
+a an the it its that this those these they them their one ones there here i me my we our you your
+is are was were be been being am do does did done have has had can could will would should shall may might must
+what which who whom whose when where why how much many any some all no not if then than
+to of in on at by for from with about as into over under or and but so also same else too very
+get gets got need needs make makes
+""".split())
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def _truncate(text, max_tokens):
+    """(text cut to max_tokens, its token count)"""
+    encoder = get_encoder()
+    ids = encoder.encode(text)
+    if len(ids) <= max_tokens:
+        return text, len(ids)
+    return encoder.decode(ids[:max_tokens]), max_tokens
+
+
+def is_follow_up(message):
+    """Short messages that lean on earlier turns ("what about auto?", "how much is it?")
+
+    A pronoun only marks a follow-up when the message has hardly any content
+    words of its own, so "Is there a cancellation fee?" stays standalone.
+    """
+    words = message.split()
+    if not 0 < len(words) <= FOLLOW_UP_MAX_WORDS:
+        return False
+    if _FOLLOW_UP_RE.search(message):
+        return True
+    content = [w for w in _WORD_RE.findall(message.lower()) if w not in _FUNCTION_WORDS]
+    return len(content) <= FOLLOW_UP_MAX_CONTENT_WORDS and _PRONOUN_RE.search(message) is not None
+
+
+class Session:
+    """Recent turns of one conversation plus a summary of older ones"""
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.turns = deque()  # (question, answer, tokens)
+        self.summary = deque()  # (line, tokens)
+        self.turn_tokens = 0
+        self.summary_tokens = 0
+        self.last_query = None
+        self.touched = time.monotonic()
+
+    def add_turn(self, question, query, answer, history_tokens, summary_tokens):
+        question, q_tokens = _truncate(question, max(1, history_tokens // 4))
+        answer, a_tokens = _truncate(answer, max(1, history_tokens - q_tokens))
+        self.turns.append((question, answer, q_tokens + a_tokens))
+        self.turn_tokens += q_tokens + a_tokens
+        self.last_query = query
+        while len(self.turns) > 1 and self.turn_tokens > history_tokens:
+            self._fold(summary_tokens)
+
+    def _fold(self, summary_tokens):
+        """Move the oldest turn into the summary, dropping the oldest summary lines past the cap"""
+        question, answer, tokens = self.turns.popleft()
+        self.turn_tokens -= tokens
+        first_sentence = _SENTENCE_END_RE.split(answer.strip(), 1)[0]
+        line, line_tokens = _truncate(f"- Q: {question} A: {first_sentence}", max(1, summary_tokens // 2))
+        self.summary.append((line, line_tokens))
+        self.summary_tokens += line_tokens
+        while self.summary and self.summary_tokens > summary_tokens:
+            self.summary_tokens -= self.summary.popleft()[1]
+
+    def history(self):
+        """(summary text or None, [(question, answer), ...]) for the prompt"""
+        summary = "\n".join(line for line, _ in self.summary) or None
+        return summary, [(question, answer) for question, answer, _ in self.turns]
+
+    def memory_bytes(self):
+        return (sum(len(q) + len(a) for q, a, _ in self.turns) + sum(len(line) for line, _ in self.summary)
+                + len(self.last_query or ""))
+
+
+class SessionStore:
+    """Sessions of one worker in an LRU with an idle TTL"""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS,
+                 history_tokens=SESSION_HISTORY_TOKENS, summary_tokens=SESSION_SUMMARY_TOKENS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, session):
+        return time.monotonic() - session.touched > self.ttl
+
+    def _evict(self):
+        # Least recently used first, so expired sessions sit at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) < self.max_sessions and not self._expired(oldest):
+                break
+            del self._sessions[oldest.id]
+            sessions_evicted.inc()
+
+    def get(self, session_id):
+        """Live session with this id, or None if it is unknown or expired"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if self._expired(session):
+                del self._sessions[session_id]
+                sessions_evicted.inc()
+                return None
+            session.touched = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id=None):
+        """The live session with this id, or a new session with a fresh id"""
+        session = self.get(session_id) if session_id else None
+        if session is not None:
+            return session
+        session = Session(secrets.token_urlsafe(16))
+        with self._lock:
+            self._evict()
+            self._sessions[session.id] = session
+        sessions_created.inc()
+        return session
+
+    def add_turn(self, session, question, query, answer):
+        with self._lock:
+            session.add_turn(question, query, answer, self.history_tokens, self.summary_tokens)
+            session.touched = time.monotonic()
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "tokens": sum(s.turn_tokens + s.summary_tokens for s in sessions),
+            "bytes": sum(s.memory_bytes() for s in sessions),
+            "created": sessions_created.value,
+            "evicted": sessions_evicted.value,
+            "follow_ups_condensed": follow_ups_condensed.value,
+        }
+
+
+def _condense_heuristic(session, message):
+    carry = " ".join(session.last_query.split()[-CONDENSE_CARRY_WORDS:])
+    return f"{carry} {message}"
+
+
+async def _condense_llm(session, message):
+    summary, turns = session.history()
+    lines = [summary] if summary else []
+    lines += [f"User: {question}\nAssistant: {answer}" for question, answer in turns]
+    response = await chat_completion(
+        model=CONDENSE_MODEL,
+        messages=[
+            {"role": "system", "content": (
+                "Rewrite the user's follow-up as one standalone search query for an insurance "
+                "knowledge base, using the conversation for context. Reply with the query only."
+            )},
+            {"role": "user", "content": "Conversation:\n" + "\n".join(lines) + f"\n\nFollow-up: {message}"},
+        ],
+        temperature=0,
+        max_tokens=64,
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+async def condense_query(session, message):
+    """Standalone retrieval query for a message; follow-ups borrow from earlier turns"""
+    if session is None or session.last_query is None or not is_follow_up(message):
+        return message
+    query = None
+    if SESSION_CONDENSE == "llm":
+        try:
+            query = await _condense_llm(session, message)
+        except Exception:
+            query = None
+    follow_ups_condensed.inc()
+    return query or _condense_heuristic(session, message)
+
+
+sessions = SessionStore()
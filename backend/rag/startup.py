@@ -0,0 +1,118 @@
+"""Startup modes that move model and index loading off the first request.
+
+lazy     load everything on first use (the default)
+warm     each worker loads and warms the model and STARTUP_COLLECTIONS in its
+         startup hook, before it accepts requests
+preload  the model weights and indexes are loaded when main is imported; under
+         `gunicorn --preload` that happens once in the parent, and the forked
+         workers share those pages copy-on-write. Each worker then only runs
+         the warm-up inference, since torch and FAISS thread pools must not
+         be started before fork.
+
+Timings of heavy imports, loads and warm-ups are kept for /stats.
+"""
+import gc
+import importlib
+import os
+import sys
+import time
+
+from rag.chunking import get_encoder
+from rag.embedder import encode, get_embedding_model, warm_up as warm_up_embedder
+from rag.rerank import RERANK_ENABLED, get_rerank_model, warm_up as warm_up_rerank
+
+# lazy, warm or preload
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "lazy")
+# Collections loaded at startup in warm and preload modes (comma-separated)
+STARTUP_COLLECTIONS = [name.strip() for name in os.environ.get("STARTUP_COLLECTIONS", "default").split(",")
+                       if name.strip()]
+
+# Imported ahead of the first request; torch comes in with sentence_transformers
+HEAVY_MODULES = ("faiss", "httpx", "groq", "sentence_transformers")
+
+_timings = {"mode": STARTUP_MODE, "imports": {}, "load": {}, "warm": {}}
+
+
+def _timed(section, name, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    _timings[section][name] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def record_import(name, seconds):
+    _timings["imports"][name] = round(seconds, 3)
+
+
+def _process_age():
+    """Seconds since this process started, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/stat", "r", encoding="utf-8") as f:
+            # starttime is field 22; fields after the ")" closing the command name start at field 3
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r", encoding="utf-8") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def record_app_import(name):
+    """Record the time from process start until the app module finished importing"""
+    seconds = _process_age()
+    if seconds is not None:
+        record_import(name, seconds)
+
+
+def import_heavy():
+    """Import the heavy libraries now, timing the ones not imported yet"""
+    for name in HEAVY_MODULES:
+        if name not in sys.modules:
+            _timed("imports", name, importlib.import_module, name)
+
+
+def load(registry, collections=STARTUP_COLLECTIONS):
+    """Load model weights and collection indexes without running any inference"""
+    import_heavy()
+    _timed("load", "embedding_model", get_embedding_model)
+    if RERANK_ENABLED:
+        _timed("load", "rerank_model", get_rerank_model)
+    _timed("load", "tokenizer", get_encoder)
+    for name in collections:
+        _timed("load", f"collection:{name}", registry.load, name)
+
+
+def preload(registry, collections=STARTUP_COLLECTIONS):
+    """Load everything in the parent process before workers are forked"""
+    load(registry, collections)
+    # Objects loaded so far are never collected; keeping the collector off
+    # them stops it dirtying shared pages in the forked workers
+    gc.freeze()
+    _timings["preloaded_pid"] = os.getpid()
+
+
+def _warm_collection(kb):
+    kb.index.search(encode(["warm up"]), 1)
+    if kb.lexical is not None:
+        kb.lexical.search("warm up", 1)
+
+
+def warm(registry, collections=STARTUP_COLLECTIONS):
+    """Load (unless preloaded before fork), then run one pass through each model and index"""
+    if "preloaded_pid" not in _timings:
+        load(registry, collections)
+    _timed("warm", "embedding_model", warm_up_embedder)
+    if RERANK_ENABLED:
+        _timed("warm", "rerank_model", warm_up_rerank)
+    for name in collections:
+        kb = registry.resident(name)
+        if kb is not None:
+            _timed("warm", f"collection:{name}", _warm_collection, kb)
+    _timings["warmed_pid"] = os.getpid()
+
+
+def startup_stats():
+    stats = dict(_timings)
+    stats["total_seconds"] = round(sum(sum(section.values()) for section in
+                                       (_timings["imports"], _timings["load"], _timings["warm"])), 3)
+    return stats
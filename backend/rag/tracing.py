@@ -0,0 +1,186 @@
+"""Per-request stage spans and an opt-in sampling profiler for slow requests.
+
+span("search") times a block into the stage_search_seconds histogram and,
+inside a request started with start_trace(), records it on that request's
+trace. Traces live in a context variable, so spans taken in threadpool
+workers (run_in_threadpool copies the context) land on the right request.
+"""
+import collections
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from rag.metrics import counter, histogram
+
+# Capture a profile of requests slower than this (0 disables the profiler)
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))
+# Interval between stack samples while the profiler is on
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+# Where collapsed-stack profiles (flamegraph input) are written
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "profiles"))
+
+request_latency = histogram("http_request_seconds", "Time from request start to the last body byte")
+request_errors = counter("http_errors_total", "Requests that raised or returned a 5xx status")
+slow_requests = counter("slow_requests_profiled_total", "Requests slower than PROFILE_SLOW_MS that were profiled")
+
+_trace = contextvars.ContextVar("rag_trace", default=None)
+_stage_histograms = {}
+
+
+def _stage_histogram(stage):
+    hist = _stage_histograms.get(stage)
+    if hist is None:
+        hist = _stage_histograms[stage] = histogram(f"stage_{stage}_seconds", f"Time spent in the {stage} stage")
+    return hist
+
+
+def start_trace():
+    """Begin collecting spans for the current request; returns the trace list"""
+    spans = []
+    _trace.set(spans)
+    return spans
+
+
+def current_trace():
+    return _trace.get()
+
+
+def record(stage, seconds):
+    """Add a stage duration measured elsewhere (e.g. time to first token)"""
+    _stage_histogram(stage).observe(seconds)
+    spans = _trace.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def server_timing(spans):
+    """Server-Timing header value summing spans per stage"""
+    totals = collections.OrderedDict()
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
+
+
+def _collapse(frame):
+    """Root-first "func (file)" frames joined by ';', the collapsed-stack format flamegraph tools read"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples every thread's stack on a timer into a short ring buffer
+
+    Slow requests ask for the samples taken during their lifetime and write
+    them as collapsed stacks. The sampler thread only exists when the
+    profiler is enabled.
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS, keep_seconds=60.0):
+        self.interval = interval_ms / 1000.0
+        self._samples = collections.deque(maxlen=max(1, int(keep_seconds / self.interval)))
+        self.start()
+        # Threads do not survive fork; preforked workers start their own sampler
+        os.register_at_fork(after_in_child=self.start)
+
+    def start(self):
+        self._samples.clear()
+        # Profiles are written off the event loop, one at a time
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-profile-writer")
+        self._thread = threading.Thread(target=self._run, name="rag-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                self._samples.append((now, _collapse(frame)))
+            time.sleep(self.interval)
+
+    def collapsed(self, start, end):
+        """Stack -> sample count for samples taken between start and end"""
+        counts = collections.Counter(stack for at, stack in list(self._samples) if start <= at <= end)
+        return counts
+
+    def dump(self, label, start, end, spans=(), directory=PROFILE_DIR):
+        """Write the request's samples as <time>-<label>.folded and its spans as .json next to it"""
+        counts = self.collapsed(start, end)
+        os.makedirs(directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() else "_" for c in label).strip("_")[:60]
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}")
+        with open(path + ".folded", "w", encoding="utf-8") as f:
+            for stack, n in counts.most_common():
+                f.write(f"{stack} {n}\n")
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"request": label, "seconds": round(end - start, 6),
+                       "spans": [[stage, round(seconds, 6)] for stage, seconds in spans]}, f)
+        return path + ".folded"
+
+    def dump_later(self, label, start, end, spans=()):
+        """Queue dump() on the writer thread, so a slow request's profile never blocks the event loop"""
+        return self._writer.submit(self.dump, label, start, end, list(spans))
+
+
+profiler = SamplingProfiler() if PROFILE_SLOW_MS > 0 else None
+
+
+class TracingMiddleware:
+    """ASGI middleware that gives every HTTP request a trace
+
+    Records http_request_seconds up to the last body byte (so streamed
+    responses are timed in full), adds a Server-Timing header with the spans
+    finished before the response started, and hands requests slower than
+    PROFILE_SLOW_MS to the profiler.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        spans = start_trace()
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if spans:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(spans).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            ended = time.perf_counter()
+            request_latency.observe(ended - started)
+            if status >= 500:
+                request_errors.inc()
+            if profiler is not None and (ended - started) * 1000 >= PROFILE_SLOW_MS:
+                slow_requests.inc()
+                profiler.dump_later(f"{scope['method']} {scope['path']}", started, ended, spans)
@@ -3,6 +3,8 @@ import React, { useState } from "react";
 export default function ChatWidget() {
   const [msgs, setMsgs] = useState([{ role: "bot", text: "Hi! Ask me about your policy." }]);
   const [text, setText] = useState("");
+  // Server-side conversation; "" asks the backend to start one
+  const [sessionId, setSessionId] = useState("");
 
   async function send() {
     const msg = text.trim();
@@ -11,16 +13,41 @@ export default function ChatWidget() {
     setMsgs((m) => [...m, { role: "user", text: msg }]);
     setText("");
 
+    // Placeholder bot message that is filled in as tokens stream in
+    const botId = Date.now();
+    setMsgs((m) => [...m, { role: "bot", text: "", id: botId }]);
+    const append = (chunk) =>
+      setMsgs((m) => m.map((x) => (x.id === botId ? { ...x, text: x.text + chunk } : x)));
+
     try {
-      const res = await fetch("http://localhost:8000/chat", {
+      const res = await fetch("http://localhost:8000/chat/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: msg }),
+        body: JSON.stringify({ message: msg, session_id: sessionId }),
       });
-      const data = await res.json();
-      setMsgs((m) => [...m, { role: "bot", text: data.answer }]);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events are separated by a blank line
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+          const raw = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          const event = (raw.match(/^event: (.*)$/m) || [])[1];
+          const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || "{}");
+          if (event === "retrieval" && data.session_id) setSessionId(data.session_id);
+          if (event === "token") append(data.text);
+          if (event === "error") append(data.error);
+        }
+      }
     } catch (err) {
-      setMsgs((m) => [...m, { role: "bot", text: "Error contacting server." }]);
+      append("Error contacting server.");
     }
   }
 